@@ -0,0 +1,119 @@
+"""
+End-to-end benchmark of `CuJiraX.to_xray` against the local mock server.
+
+    python -m benchmarks.e2e --features 20 --scenarios 50 --latency 0.02 --rate-limit 50
+
+The first run starts from an empty Jira, so every test, test set and
+execution is created; the following `--warm-runs` find them all. Each run
+reports its wall time, the requests sent per endpoint and the peak memory
+traced by tracemalloc (which slows the run down, see `--no-tracemalloc`).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from loguru import logger
+
+import cujirax
+import cujirax.xray as xray
+from benchmarks import mock_server, reports
+
+
+def to_xray(client: cujirax.CuJiraX, report: str, args: argparse.Namespace) -> list:
+    options = dict(trusted_input=args.trusted_input, consolidate_results=args.consolidate_results)
+    if args.use_async:
+        return asyncio.run(client.to_xray_async(report, max_concurrency=args.max_workers, **options))
+    return client.to_xray(report, max_workers=args.max_workers, **options)
+
+
+def run(name: str, report: str, url: str, state: mock_server.State, args: argparse.Namespace) -> dict:
+    state.reset_counters()
+    client = cujirax.CuJiraX(args.project)
+    client.jira.url = url
+    if args.test_cache:
+        client.set_test_cache(args.test_cache)
+
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+    started = time.perf_counter()
+    output = to_xray(client, report, args)
+    wall = time.perf_counter() - started
+    peak = None
+    if not args.no_tracemalloc:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "run": name,
+        "wall_s": round(wall, 3),
+        "peak_mb": round(peak / 2 ** 20, 2) if peak is not None else None,
+        "requests": sum(state.counts.values()),
+        "throttled": state.throttled,
+        "request_mb": round(state.bytes_in / 2 ** 20, 2),
+        "features": len(output),
+        "errors": sum(1 for o in output if "error" in o),
+        "endpoints": dict(sorted(state.counts.items())),
+    }
+
+
+def print_result(result: dict) -> None:
+    memory = f"{result['peak_mb']:.2f} MB peak" if result["peak_mb"] is not None else "memory not traced"
+    print(f"{result['run']}: {result['wall_s']:.3f}s, {result['requests']} requests "
+          f"({result['throttled']} throttled, {result['request_mb']} MB sent), {memory}, "
+          f"{result['features']} features, {result['errors']} errors")
+    for endpoint, count in result["endpoints"].items():
+        print(f"    {count:6d}  {endpoint}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--features", type=int, default=10)
+    parser.add_argument("--scenarios", type=int, default=20)
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--report", help="benchmark this report instead of a generated one")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--rate-limit", type=float, help="requests per second before answering 429")
+    parser.add_argument("--working-polls", type=int, default=0, help="'working' answers before a job succeeds")
+    parser.add_argument("--warm-runs", type=int, default=1)
+    parser.add_argument("--max-workers", type=int, help="to_xray max_workers, or max_concurrency with --async")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="benchmark to_xray_async")
+    parser.add_argument("--trusted-input", action="store_true")
+    parser.add_argument("--consolidate-results", action="store_true")
+    parser.add_argument("--test-cache", help="SQLite test cache shared by the runs")
+    parser.add_argument("--project", default="BENCH")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="do not trace memory, for exact timings")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="write the results to this json file")
+    args = parser.parse_args()
+    if args.use_async and not args.max_workers:
+        args.max_workers = 20
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    # the mock accepts any credentials
+    for name in ("JIRA_EMAIL", "JIRA_SECRET", "XRAY_CLIENT_ID", "XRAY_CLIENT_SECRET"):
+        os.environ.setdefault(name, "bench")
+    server, state, url = mock_server.serve(mock_server.State(args.latency, args.rate_limit, args.working_polls))
+    xray.xray_url = url
+    with tempfile.TemporaryDirectory() as tmp:
+        report = args.report or reports.generate(
+            os.path.join(tmp, "report.json"), args.features, args.scenarios, args.steps)
+        results = [run("cold", report, url, state, args)]
+        results += [run(f"warm {i + 1}", report, url, state, args) for i in range(args.warm_runs)]
+    server.shutdown()
+
+    for result in results:
+        print_result(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"arguments": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Import time budget of the package, measured in fresh interpreters.
+
+    python -m benchmarks.import_time
+
+Each statement reports the best of `--repeat` runs and the heavy modules
+it must not load. Exits with status 1 when a statement is over its budget
+(times `--scale`, for slower machines) or loads one of those modules.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+# statement, budget in seconds, modules it must not import
+BUDGETS = [
+    ("import cujirax", 0.005, ("pydantic", "requests", "atlassian", "cujirax.core")),
+    ("from cujirax import CuJiraX", 0.3, ("atlassian", "httpx", "cujirax.xray.graphql")),
+    ("import cujirax.xray.graphql", 0.3, ("atlassian", "httpx")),
+]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+exec(sys.argv[1])
+print(json.dumps({"seconds": time.perf_counter() - started, "modules": sorted(sys.modules)}))
+"""
+
+
+def measure(statement: str) -> dict:
+    out = subprocess.run([sys.executable, "-c", PROBE, statement], check=True, capture_output=True, text=True)
+    return json.loads(out.stdout)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget")
+    args = parser.parse_args()
+
+    ok = True
+    for statement, budget, forbidden in BUDGETS:
+        runs = [measure(statement) for _ in range(args.repeat)]
+        seconds = min(run["seconds"] for run in runs)
+        loaded = sorted(set(forbidden) & set(runs[0]["modules"]))
+        over = seconds > budget * args.scale
+        ok = ok and not over and not loaded
+        print(f"{statement:<32} {seconds * 1000:8.1f} ms  budget {budget * args.scale * 1000:6.1f} ms"
+              f"{'  OVER BUDGET' if over else ''}{'  loads ' + ', '.join(loaded) if loaded else ''}")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Microbenchmarks of the CPU side of `to_xray`, without any network.
+
+    python -m benchmarks.micro --save baseline.json
+    python -m benchmarks.micro --compare baseline.json
+
+Every stage runs on generated reports of each `--steps` size and reports
+the best of `--repeat` timings. `--compare` prints the ratio to a saved
+baseline and exits with status 1 when a stage is slower than
+`--threshold` times its baseline (and by more than a millisecond, to
+ignore the noise of the fastest stages).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+from typing import Callable, Dict
+
+from loguru import logger
+
+import cujirax
+import cujirax.cucumber as cucumber
+import cujirax.cucumber_fast as cucumber_fast
+import cujirax.xray as xray
+import cujirax.xray.import_results as result
+from cujirax.index import TestIndex
+from cujirax.jira import Jirakey
+from benchmarks import reports
+
+STEPS_PER_SCENARIO = 5
+SCENARIOS_PER_FEATURE = 50
+
+
+def best_of(func: Callable, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def stages(path: str) -> Dict[str, Callable]:
+    """The benchmarked stages on the report at `path`, each a callable without arguments."""
+    CuJiraX = cujirax.CuJiraX
+    features = cucumber.Model.parse_file(path).__root__
+    elements = [el for f in features for el in f.elements]
+    names = [CuJiraX.scenarioid_to_tescasename(el.id, el.keyword) for el in elements]
+    test_cases = [CuJiraX._new_testcase(el, "BENCH") for el in elements]
+
+    # every test is already known, so resolving never reaches Jira
+    index = TestIndex(types.SimpleNamespace(key="BENCH"))
+    for n, name in enumerate(names, 1):
+        index.add(name, Jirakey(f"BENCH-{n}"))
+    tests, _ = CuJiraX._get_results(elements, index, ignore_duplicate=True)
+    request = result.RequestBody(info=result.Info(summary="bench", description="bench"), tests=tests)
+
+    return {
+        "parse_file": lambda: cucumber.Model.parse_file(path),
+        "parse_file_trusted": lambda: cucumber_fast.parse_file(path),
+        "iter_features": lambda: sum(1 for _ in cucumber.iter_features(path)),
+        "scenarioid_to_tescasename": lambda: [
+            CuJiraX.scenarioid_to_tescasename(el.id, el.keyword) for el in elements],
+        "new_testcase": lambda: [CuJiraX._new_testcase(el, "BENCH") for el in elements],
+        "get_results": lambda: CuJiraX._get_results(elements, index, ignore_duplicate=True),
+        "serialize_test_cases": lambda: xray._serialize(test_cases),
+        "serialize_results": lambda: xray._serialize(request),
+    }
+
+
+def run(sizes, repeat: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for steps in sizes:
+            scenarios = max(1, steps // STEPS_PER_SCENARIO)
+            features = max(1, scenarios // SCENARIOS_PER_FEATURE)
+            path = reports.generate(
+                os.path.join(tmp, f"report_{steps}.json"), features, scenarios // features, STEPS_PER_SCENARIO)
+            timings = results[str(steps)] = {}
+            for name, func in stages(path).items():
+                timings[name] = round(best_of(func, repeat), 6)
+                print(f"{steps:>8} steps  {name:<28} {timings[name] * 1000:10.2f} ms")
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """Print each timing against `baseline`; return False if any is slower than `threshold` times it."""
+    ok = True
+    for steps, timings in results.items():
+        for name, seconds in timings.items():
+            before = baseline.get(steps, {}).get(name)
+            if not before:
+                continue
+            ratio = seconds / before
+            slower = ratio > threshold and seconds - before > 0.001
+            ok = ok and not slower
+            print(f"{steps:>8} steps  {name:<28} {ratio:6.2f}x{'  REGRESSION' if slower else ''}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, nargs="+", default=[1000, 10000, 50000, 200000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="write the timings to this baseline file")
+    parser.add_argument("--compare", help="compare the timings to this baseline file")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args()
+
+    # the stages log every element at INFO level
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    results = run(args.steps, args.repeat)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "cujirax": cujirax.__version__, "results": results}, f,
+                      indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        if not compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
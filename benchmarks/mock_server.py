@@ -0,0 +1,247 @@
+"""
+Local stand-in for the Jira and Xray Cloud endpoints used by cujirax.
+
+It keeps issues in memory and answers just enough of each API for
+`CuJiraX.to_xray` to run end to end. A fixed `latency` is added to every
+request, and `rate_limit` requests per second are allowed before it
+answers 429 with a Retry-After header.
+"""
+import collections
+import itertools
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+# a JWT-looking token expiring in 2100, so the token provider can read its exp claim
+TOKEN = "bench.eyJleHAiOjQxMDI0NDQ4MDB9.sig"
+
+
+class TokenBucket:
+    """Allow `rate` requests per second with bursts of up to `burst` requests."""
+
+    def __init__(self, rate: float, burst: float = None) -> None:
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> Optional[float]:
+        """Take a token; return None on success, else the seconds until one is available."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return None
+            return (1 - self.tokens) / self.rate
+
+
+def _words(text: str) -> List[str]:
+    """Words of a summary as Jira's text index sees them: case-insensitive, split on punctuation."""
+    return re.findall(r"[^\W_]+", text.lower())
+
+
+class State:
+    """Issues, import jobs and request counters of one mock server."""
+
+    def __init__(self, latency: float = 0.0, rate_limit: float = None, working_polls: int = 0) -> None:
+        self.latency = latency
+        self.bucket = TokenBucket(rate_limit) if rate_limit else None
+        self.working_polls = working_polls
+        self.lock = threading.Lock()
+        self.seq = itertools.count(1)
+        self.issues: Dict[str, dict] = {}
+        self.tokens: Dict[str, set] = collections.defaultdict(set)
+        self.jobs: Dict[str, list] = {}
+        self.polls = collections.Counter()
+        self.counts = collections.Counter()
+        self.throttled = 0
+        self.bytes_in = 0
+
+    def reset_counters(self) -> None:
+        with self.lock:
+            self.counts.clear()
+            self.throttled = 0
+            self.bytes_in = 0
+
+    def create(self, fields: dict) -> dict:
+        with self.lock:
+            n = next(self.seq)
+            key = f"{fields.get('project', {}).get('key', 'BENCH')}-{n}"
+            issue = self.issues[key] = {"id": str(10000 + n), "key": key, "fields": {
+                "summary": fields.get("summary"),
+                "description": fields.get("description"),
+                "issuetype": {"name": fields.get("issuetype", {}).get("name", "Test")},
+                "labels": fields.get("labels") or [],
+            }}
+            for token in _words(fields.get("summary") or ""):
+                self.tokens[token].add(key)
+            return issue
+
+    def search(self, jql: str) -> List[dict]:
+        """Evaluate the handful of JQL shapes cujirax sends."""
+        keys = re.search(r"key in \(([^)]*)\)", jql) or re.search(r"key\s*=\s*([A-Z0-9_]+-[0-9]+)", jql)
+        if keys:
+            wanted = [k.strip() for k in keys.group(1).split(",")]
+            return [self.issues[k] for k in wanted if k in self.issues]
+
+        issuetype = re.search(r'issuetype="([^"]+)"', jql)
+        labels = re.findall(r"labels='([^']*)'", jql)
+        clauses = re.findall(r'summary~"([^"]*)"', jql)
+        if any(not clause.strip() for clause in clauses):
+            # like Jira, instead of silently matching nothing
+            raise ValueError("The field 'summary' does not support searching for an empty string.")
+        with self.lock:
+            if clauses:
+                candidates = set()
+                for clause in clauses:
+                    # summary~ is a text search: every word of the clause must appear in the summary
+                    sets = [self.tokens.get(t, set()) for t in _words(clause)]
+                    candidates |= set.intersection(*sets) if sets else set()
+                found = [self.issues[k] for k in sorted(candidates, key=lambda k: int(k.split("-")[1]))]
+            else:
+                found = list(self.issues.values())
+        return [
+            i for i in found
+            if (issuetype is None or i["fields"]["issuetype"]["name"] == issuetype.group(1))
+            and all(label in i["fields"]["labels"] for label in labels)
+        ]
+
+
+def _graphql(state: State, query: str, variables: dict) -> dict:
+    """Answer the issue id lookups and add-to mutations of `cujirax.xray.graphql`."""
+    data = {}
+    for alias, name in re.findall(r"(?:(\w+)\s*:\s*)?(\w+)\s*\(", query):
+        if name in ("query", "mutation", "jira") or alias in ("query", "mutation"):
+            continue
+        if name.startswith("get"):
+            issues = state.search(variables.get("jql", ""))
+            data[alias or name] = {"total": len(issues), "results": [
+                {"issueId": i["id"], "jira": {"key": i["key"]}} for i in issues]}
+        elif name.startswith("add"):
+            data[alias or name] = {"addedTests": [], "addedTestExecutions": [], "warning": None}
+        else:
+            data[alias or name] = None
+    return {"data": data}
+
+
+def make_handler(state: State):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            self.route("GET")
+
+        def do_POST(self) -> None:
+            self.route("POST")
+
+        def do_PUT(self) -> None:
+            self.route("PUT")
+
+        def send(self, status: int, body=None, headers: dict = None) -> None:
+            payload = json.dumps(body).encode() if body is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def read_body(self) -> bytes:
+            if self.headers.get("Transfer-Encoding") == "chunked":
+                chunks = []
+                while True:
+                    size = int(self.rfile.readline().strip(), 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        return b"".join(chunks)
+                    chunks.append(self.rfile.read(size))
+                    self.rfile.readline()
+            size = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(size) if size else b""
+
+        def route(self, method: str) -> None:
+            url = urlparse(self.path)
+            body = self.read_body()
+            endpoint = f"{method} {re.sub(r'[A-Z][A-Z0-9_]*-[0-9]+|[0-9a-f]{8,}', '{id}', url.path)}"
+            with state.lock:
+                state.counts[endpoint] += 1
+                state.bytes_in += len(body)
+            if state.latency:
+                time.sleep(state.latency)
+            wait = state.bucket.acquire() if state.bucket else None
+            if wait is not None:
+                with state.lock:
+                    state.throttled += 1
+                return self.send(429, {"error": "rate limited"}, {"Retry-After": str(math.ceil(wait))})
+            status, response = self.dispatch(method, url.path, parse_qs(url.query), body)
+            self.send(status, response)
+
+        def dispatch(self, method: str, path: str, query: dict, body: bytes) -> Tuple[int, object]:
+            if path == "/api/v2/authenticate":
+                return 200, TOKEN
+            if path == "/rest/api/2/search":
+                start = int(query.get("startAt", [0])[0])
+                limit = int(query.get("maxResults", [50])[0])
+                try:
+                    issues = state.search(query["jql"][0])
+                except ValueError as e:
+                    return 400, {"errorMessages": [str(e)]}
+                return 200, {"issues": issues[start:start + limit], "total": len(issues), "startAt": start}
+            if path == "/rest/api/2/issue" and method == "POST":
+                issue = state.create(json.loads(body)["fields"])
+                return 201, {"id": issue["id"], "key": issue["key"]}
+            if path == "/rest/api/2/issue/bulk":
+                issues = [state.create(i["fields"]) for i in json.loads(body)["issueUpdates"]]
+                return 201, {"issues": [{"id": i["id"], "key": i["key"]} for i in issues], "errors": []}
+            match = re.match(r"/rest/api/2/issue/([A-Z][A-Z0-9_]*-[0-9]+)$", path)
+            if match and method == "PUT":
+                issue = state.issues.get(match.group(1))
+                if issue is None:
+                    return 404, {"errorMessages": ["Issue does not exist"]}
+                issue["fields"].update(json.loads(body)["fields"])
+                return 204, None
+            if path == "/api/v2/import/test/bulk":
+                job_id = f"{next(state.seq):016x}"
+                state.jobs[job_id] = [
+                    {"elementNumber": n, "id": i["id"], "key": i["key"]}
+                    for n, i in enumerate(state.create(tc["fields"]) for tc in json.loads(body))]
+                return 200, {"jobId": job_id}
+            match = re.match(r"/api/v2/import/test/bulk/([0-9a-f]+)/status", path)
+            if match:
+                job_id = match.group(1)
+                with state.lock:
+                    state.polls[job_id] += 1
+                    working = state.polls[job_id] <= state.working_polls
+                if working:
+                    return 200, {"status": "working"}
+                return 200, {"status": "successful", "result": {"issues": state.jobs[job_id], "errors": [], "warnings": []}}
+            if path.startswith("/api/v2/import/execution"):
+                issue = state.create({"summary": "execution", "issuetype": {"name": "Test Execution"}})
+                return 200, {"id": issue["id"], "key": issue["key"]}
+            if path == "/api/v2/graphql":
+                request = json.loads(body)
+                return 200, _graphql(state, request["query"], request.get("variables") or {})
+            return 404, {"error": f"{method} {path} is not mocked"}
+
+    return Handler
+
+
+def serve(state: State = None) -> Tuple[ThreadingHTTPServer, State, str]:
+    """Start a mock server on a free local port; return it with its state and base url."""
+    state = state or State()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}"
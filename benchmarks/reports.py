@@ -0,0 +1,61 @@
+"""
+Synthetic cucumber json reports for the benchmarks.
+
+    python -m benchmarks.reports --features 20 --scenarios 50 --steps 5 report.json
+"""
+import argparse
+import json
+
+
+def feature(f: int, scenarios: int, steps: int, fail_every: int = 7) -> dict:
+    elements = []
+    for s in range(scenarios):
+        elements.append({
+            "keyword": "Scenario",
+            "type": "scenario",
+            "id": f"feature-{f};scenario-{s}",
+            "line": 3 + s * (steps + 1),
+            "name": f"scenario {s}",
+            "tags": [{"name": "@bench", "line": 1}],
+            "steps": [{
+                "keyword": "Given " if k == 0 else "And ",
+                "line": 4 + s * (steps + 1) + k,
+                "name": f"step {k} of scenario {s}",
+                "result": {
+                    "status": "failed" if fail_every and (s * steps + k) % fail_every == 0 else "passed",
+                    "duration": 1000000,
+                },
+            } for k in range(steps)],
+        })
+    return {
+        # half of the names have no word Jira can search, like most real feature file names
+        "uri": f"features/feature_{f}.feature" if f % 2 else f"features/feature-{f}.feature",
+        "id": f"feature-{f}",
+        "keyword": "Feature",
+        "name": f"Feature {f}",
+        "line": 1,
+        "description": f"Benchmark feature {f}",
+        "elements": elements,
+    }
+
+
+def generate(path: str, features: int, scenarios: int, steps: int = 5, fail_every: int = 7) -> str:
+    """Write a report of `features` x `scenarios` scenarios of `steps` steps each to `path`."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([feature(i, scenarios, steps, fail_every) for i in range(features)], f)
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--features", type=int, default=10)
+    parser.add_argument("--scenarios", type=int, default=20)
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--fail-every", type=int, default=7, help="fail every n-th step, 0 to pass them all")
+    args = parser.parse_args()
+    generate(args.path, args.features, args.scenarios, args.steps, args.fail_every)
+
+
+if __name__ == "__main__":
+    main()
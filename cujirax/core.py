@@ -0,0 +1,783 @@
+"""
+`CuJiraX`, the cucumber json to Xray uploader.
+
+The Jira clients are imported when a `CuJiraX` is created, so importing
+this module does not load atlassian.
+"""
+from __future__ import annotations
+
+import asyncio
+import datetime
+import functools
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cujirax.cucumber as cucumber
+import cujirax.cucumber_fast as cucumber_fast
+import cujirax.metrics as metrics
+import cujirax.shards as shards
+import cujirax.xray as xray
+import cujirax.xray.import_results as result
+import cujirax.xray.import_tests as test
+from cujirax import __version__
+from cujirax.cucumber import Element
+from cujirax.index import TestIndex
+from cujirax.manifest import Manifest, fingerprint, scenario_hash
+from cujirax.models import Jirakey, Project
+from cujirax.store import TestStore
+from loguru import logger
+from collections import Counter, deque
+from typing import TYPE_CHECKING, List, Tuple, Union
+
+if TYPE_CHECKING:
+    from cujirax.jira import AsyncJiraX, JiraX
+
+
+class DuplicateValueError(Exception):
+    """Raised when a duplicate Scenario is found."""
+    pass
+
+
+def _with_metrics(func):
+    """Collect the metrics of one feature into its output entry, under 'metrics'."""
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with metrics.collect() as feature_metrics:
+                root = await func(*args, **kwargs)
+            root['metrics'] = feature_metrics.dict()
+            return root
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.collect() as feature_metrics:
+                root = func(*args, **kwargs)
+            root['metrics'] = feature_metrics.dict()
+            return root
+    return wrapper
+
+
+class CuJiraX:
+    def __init__(self, jira_project: str, parent_testset_key: str = None, addional_identifier: str = None) -> None:
+        from cujirax.jira import JiraX
+
+        self.jira_project = jira_project
+        self.jira = JiraX(jira_project)
+        self.test_index = None
+        self.test_store = None
+        self.bulk_import_options = {}
+        self.manifest_options = {}
+        self.manifest = None
+        self.run_metrics = None
+        self._pending_results = None
+        self._execution_locks = {}
+        self._locks_guard = threading.Lock()
+        
+        self.testexecution = None
+        self.testexecution_name = None
+        self.testexecution_desc = None
+        self.parent_testset_key = parent_testset_key
+        self.result_info = result.Info(summary="TBA", description="TBA")
+        self.addional_identifier = addional_identifier
+
+    def set_testsut_version(self, version: str):
+        self.result_info.version = version
+    
+    def set_test_user(self, user: str):
+        self.result_info.user = user
+
+    def set_test_revision(self, rev: str):
+        self.result_info.revision = rev
+
+    def set_test_startdate(self, date):
+        self.result_info.startDate = date
+
+    def set_test_finishdate(self, date):
+        self.result_info.finishDate = date
+
+    def set_testexecution(self, jira_key: str):
+        try:
+            self.testexecution = str(Jirakey(jira_key))
+        except ValueError:
+            self.testexecution = None
+
+    def set_testplan(self, testplan_key: str):
+        try:
+            self.result_info.testPlanKey = str(Jirakey(testplan_key))
+        except ValueError:
+            self.result_info.testPlanKey = None
+
+    def set_test_environments(self, environments: list):
+        self.result_info.testEnvironments = environments
+
+
+    def set_testexecution_name(self, testexecution_name: str):
+        self.testexecution_name = testexecution_name if testexecution_name else None
+
+    def set_testexecution_desc(self, description: str):
+        self.testexecution_desc = description
+
+    def set_bulk_import_options(self, chunk_size: int = 500, max_workers: int = 4, timeout: float = 600):
+        """Split test imports into `chunk_size` jobs, `max_workers` submitted and polled at once."""
+        self.bulk_import_options = dict(chunk_size=chunk_size, max_workers=max_workers, timeout=timeout)
+
+    def set_test_cache(self, path: str):
+        """Reuse test keys across runs through a SQLite file at `path`."""
+        self.test_store = TestStore(path) if path else None
+
+    def set_manifest(self, path: str, skip_lookups: bool = False):
+        """
+        Keep a manifest of the synced scenarios at `path` for incremental runs.
+
+        Scenarios unchanged since the manifest was written skip their
+        description update; with `skip_lookups` their recorded test key is
+        also trusted without searching Jira.
+        """
+        self.manifest_options = dict(path=path, skip_lookups=skip_lookups) if path else {}
+
+    def to_xray(
+            self, 
+            cucumber_json: Union[str, List[str]],
+            import_result=True, 
+            import_testcase=True,
+            ignore_duplicate=True,
+            max_workers: int = None,
+            trusted_input=False,
+            consolidate_results=False,
+            max_tests_per_import: int = 1000
+        )-> list:
+        """
+        Import the tests and results of every feature in `cucumber_json`.
+
+        A single report is parsed lazily, one feature at a time, so uploads
+        start while the rest of the report is still being read. A list of
+        paths or a glob is parsed on a process pool and merged by feature
+        `uri` first (see `cujirax.shards`), then resolved in one lookup pass
+        and their missing test sets created with a single bulk request.
+        `trusted_input` skips the pydantic validation in favour of the
+        compact `cucumber_fast` records. With `max_workers` greater than 1,
+        features are processed in parallel and the error of a failing
+        feature is returned in its output entry under 'error' instead of
+        aborting the other features. `consolidate_results` sends the results
+        of all features sharing a test execution in one import, split every
+        `max_tests_per_import` tests.
+
+        Each output entry carries the phase timings and API call counters of
+        its feature under 'metrics' (see `cujirax.metrics`); the totals of
+        the whole run, shared work included, are kept in `run_metrics`.
+        """
+        with metrics.collect() as run_metrics:
+            self.test_index = TestIndex(self.jira, self.test_store)
+            self.jira.reset_containers()
+            self.manifest = self._load_manifest()
+            self._pending_results = {} if consolidate_results else None
+            features = self._iter_features(cucumber_json, trusted_input)
+            if isinstance(features, list):
+                for f in features:
+                    self._unchanged(f)
+                with metrics.phase("resolve_tests"):
+                    self.test_index.resolve(self._test_names(features))
+                with metrics.phase("containers"):
+                    self.jira.create_testsets_bulk([(f.uri.split("/")[-1], f.description or "TBA") for f in features])
+            args = (import_result, import_testcase, ignore_duplicate)
+
+            if not max_workers or max_workers <= 1:
+                output = [self._feature_to_xray(f, *args) for f in features]
+            else:
+                output = []
+                pending = deque()
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    for f in features:
+                        pending.append((f.uri, pool.submit(metrics.bind(self._feature_to_xray), f, *args)))
+                        # bound the number of parsed features held in memory
+                        while len(pending) >= 2 * max_workers:
+                            output.append(self._feature_result(*pending.popleft()))
+                    while pending:
+                        output.append(self._feature_result(*pending.popleft()))
+
+            for roots, req in self._consolidated_requests(max_tests_per_import):
+                with metrics.phase("import_results"):
+                    try:
+                        self._apply_consolidated(roots, result.import_xray_json_results(req))
+                    except Exception as e:
+                        self._consolidated_error(roots, req, e)
+            self._save_manifest(output)
+        self.run_metrics = run_metrics.dict()
+        return output
+
+    def import_cucumber_results(self, cucumber_json: str, per_feature=False) -> list:
+        """
+        Import the results of `cucumber_json` with Xray's cucumber multipart endpoint.
+
+        The report is streamed from disk as is and Xray matches scenarios to
+        tests itself, so no test is created or looked up in Jira. With
+        `per_feature`, each feature is sent as its own report and gets its
+        own Test Execution, named like the ones of `to_xray`. Every import
+        creates a new Test Execution.
+        """
+        if not per_feature:
+            name = os.path.basename(cucumber_json)
+            return [self._import_cucumber(cucumber_json, name, self.testexecution_desc or "TBA")]
+        return [
+            self._import_cucumber(
+                json.dumps([raw]).encode(), raw["uri"].split("/")[-1],
+                self.testexecution_desc or raw.get("description") or "TBA", uri=raw["uri"])
+            for raw in cucumber.iter_raw_features(cucumber_json)
+        ]
+
+    def _import_cucumber(self, results: Union[str, bytes], name: str, description: str, **root) -> dict:
+        testexecution_name = self.testexecution_name or name + " :: " + datetime.date.today().strftime("%Y%m%d")
+        if self.addional_identifier:
+            testexecution_name = f"{self.addional_identifier} :: {testexecution_name}"
+        info = result.CucumberInfo(
+            fields=result.ExecutionFields(
+                project=Project(key=self.jira_project),
+                summary=testexecution_name,
+                description=description,
+                labels=[l for l in [f'c{datetime.date.today().strftime("%Y%m%d")}', self.addional_identifier] if l]
+            ),
+            xrayFields=result.XrayFields(
+                testPlanKey=self.result_info.testPlanKey,
+                environments=self.result_info.testEnvironments
+            )
+        )
+        res = result.import_cucumber_multipart(results, info)
+        response = res.json()
+        root.update({
+            'test_execution': response.get('key') if isinstance(response, dict) else None,
+            'testexecution_name': testexecution_name,
+            'test_plan': self.result_info.testPlanKey,
+            'test_environments': self.result_info.testEnvironments,
+            'import_result_status': res.status_code,
+            'import_result_response': response
+        })
+        return root
+
+    @staticmethod
+    def _iter_features(cucumber_json: Union[str, List[str]], trusted_input: bool):
+        """A lazy iterator for a single report, the merged list of features for several shards."""
+        if shards.is_multi_shard(cucumber_json):
+            return shards.load_shards(cucumber_json, trusted_input)
+        if trusted_input:
+            return cucumber_fast.iter_features(cucumber_json)
+        return cucumber.iter_features(cucumber_json)
+
+    @classmethod
+    def _test_names(cls, features: list) -> List[str]:
+        return [cls.scenarioid_to_tescasename(el.id, el.keyword) for f in features for el in f.elements or []]
+
+    @staticmethod
+    def _feature_result(uri: str, future) -> dict:
+        try:
+            return future.result()
+        except Exception as e:
+            logger.exception(f"{uri}: {e}")
+            return {'uri': uri, 'error': str(e)}
+
+    @_with_metrics
+    def _feature_to_xray(self, f: cucumber.Feature, import_result, import_testcase, ignore_duplicate) -> dict:
+        root = {}
+        testset_name = f.uri.split("/")[-1]
+        testexecution_name = self.testexecution_name or testset_name + " :: " + datetime.date.today().strftime("%Y%m%d") 
+        if self.addional_identifier:
+            testexecution_name = f"{self.addional_identifier} :: {testexecution_name}"
+
+        with metrics.phase("containers"):
+            ticket_ts, ticket_te = [
+                self.jira.create_testset(
+                    summary=testset_name, 
+                    description=f.description or "TBA"
+                ),
+                self.testexecution or self.jira.create_testexecution(
+                    summary=testexecution_name, 
+                    description=self.testexecution_desc or f.description or "TBA",
+                    labels=[f'c{datetime.date.today().strftime("%Y%m%d")}', self.addional_identifier]
+                ),
+            ]
+        root.update({
+            'test_set': str(ticket_ts),
+            'testset_name': testset_name,
+            'parent_testset': self.parent_testset_key,
+            'test_execution': str(ticket_te),
+            'testexecution_name': testexecution_name,
+            'test_plan': self.result_info.testPlanKey,
+            'test_environments': self.result_info.testEnvironments
+        })
+
+        # Import Test cases
+        if import_testcase:
+            unchanged = self._unchanged(f)
+            try:
+                with metrics.phase("resolve_tests"):
+                    exists, new = self._split_elements_to_exist_and_new(
+                        elements=f.elements, 
+                        index=self.test_index, 
+                        ignore_duplicate=ignore_duplicate
+                    )
+            except ValueError as e:
+                raise DuplicateValueError(f"{str(ticket_te)}:{f.uri}:{str(e)}")
+            
+            with metrics.phase("update_descriptions"):
+                updates = [self._update_description_if_exist(x, self.jira, self.test_index, unchanged) for x in exists]
+            root.update({
+                'existing_tests': [str(key) for key, _ in updates],
+                'updated_tests': sum(1 for _, updated in updates if updated),
+                'unchanged_tests': sum(1 for _, updated in updates if not updated),
+            })
+
+            logger.info(root)
+            
+            test_cases = [n for n in map(lambda x: self._new_testcase(x, self.jira_project, ticket_ts, self.parent_testset_key), new)]
+            if test_cases:
+                with metrics.phase("import_tests"):
+                    imported = test.bulk_import_chunks(test_cases, **self.bulk_import_options)
+                self.test_index.add_bulk_import(test_cases, imported.dict())
+                root.update({
+                    'import_tests_status': imported.status,
+                    'import_tests_errors': imported.result.errors,
+                })
+            self._record(f)
+        
+        # Import Results
+        if import_result:
+            info = self.result_info.copy(update={
+                'summary': testexecution_name,
+                'description': self.testexecution_desc or f.description or "TBA"
+            })
+            
+            with metrics.phase("aggregate_results"):
+                _tests, _result = self._get_results(f.elements, self.test_index, ignore_duplicate)
+            logger.debug("tests:" + str(_tests) + ", result: " + _result)
+            req = result.RequestBody(
+                info=info,
+                tests= _tests,
+                testExecutionKey=str(ticket_te)
+            )
+            root.update({'result': _result})
+            if self._pending_results is not None:
+                self._defer_results(root, req)
+                return root
+            # Xray serializes imports into one execution, keep them ordered on our side too
+            with metrics.phase("import_results"), self._execution_lock(str(ticket_te)):
+                res = result.import_xray_json_results(req)
+            root.update({
+                'import_result_status': res.status_code,
+                'import_result_response': res.json()
+            })
+        return root
+
+    async def to_xray_async(
+            self,
+            cucumber_json: Union[str, List[str]],
+            import_result=True,
+            import_testcase=True,
+            ignore_duplicate=True,
+            max_concurrency: int = 20,
+            trusted_input=False,
+            consolidate_results=False,
+            max_tests_per_import: int = 1000
+        ) -> list:
+        """
+        Asynchronous counterpart of `to_xray`, built on httpx.
+
+        Features are read lazily from the report and processed concurrently
+        on the running event loop, with at most `max_concurrency` features
+        and connections per host in flight. Errors are returned per feature
+        under 'error'.
+        """
+        from cujirax.jira import AsyncJiraX
+
+        jira = AsyncJiraX.from_jira(self.jira, max_connections=max_concurrency)
+        self.test_index = TestIndex(jira, self.test_store)
+        self.manifest = self._load_manifest()
+        self._pending_results = {} if consolidate_results else None
+        locks = {}
+        args = (import_result, import_testcase, ignore_duplicate)
+        output = []
+        pending = deque()
+
+        async def feature_result(uri, task):
+            try:
+                return await task
+            except Exception as e:
+                logger.opt(exception=e).error(f"{uri}: {e}")
+                return {'uri': uri, 'error': str(e)}
+
+        with metrics.collect() as run_metrics:
+            try:
+                async with xray.async_client(max_connections=max_concurrency) as client:
+                    await xray.login_async(client)
+                    features = self._iter_features(cucumber_json, trusted_input)
+                    if isinstance(features, list):
+                        for f in features:
+                            self._unchanged(f)
+                        with metrics.phase("resolve_tests"):
+                            await self.test_index.resolve_async(self._test_names(features))
+                    for f in features:
+                        task = asyncio.ensure_future(self._feature_to_xray_async(f, jira, client, locks, *args))
+                        pending.append((f.uri, task))
+                        while len(pending) >= max_concurrency:
+                            output.append(await feature_result(*pending.popleft()))
+                    while pending:
+                        output.append(await feature_result(*pending.popleft()))
+                    for roots, req in self._consolidated_requests(max_tests_per_import):
+                        with metrics.phase("import_results"):
+                            try:
+                                self._apply_consolidated(
+                                    roots, await result.import_xray_json_results_async(req, client))
+                            except Exception as e:
+                                self._consolidated_error(roots, req, e)
+                self._save_manifest(output)
+            finally:
+                for _, task in pending:
+                    task.cancel()
+                await jira.aclose()
+        self.run_metrics = run_metrics.dict()
+        return output
+
+    @_with_metrics
+    async def _feature_to_xray_async(self, f: cucumber.Feature, jira: AsyncJiraX, client, locks: dict,
+                                     import_result, import_testcase, ignore_duplicate) -> dict:
+        root = {}
+        testset_name = f.uri.split("/")[-1]
+        testexecution_name = self.testexecution_name or testset_name + " :: " + datetime.date.today().strftime("%Y%m%d")
+        if self.addional_identifier:
+            testexecution_name = f"{self.addional_identifier} :: {testexecution_name}"
+
+        with metrics.phase("containers"):
+            ticket_ts = await jira.create_testset(
+                summary=testset_name,
+                description=f.description or "TBA"
+            )
+            ticket_te = self.testexecution or await jira.create_testexecution(
+                summary=testexecution_name,
+                description=self.testexecution_desc or f.description or "TBA",
+                labels=[f'c{datetime.date.today().strftime("%Y%m%d")}', self.addional_identifier]
+            )
+        root.update({
+            'test_set': str(ticket_ts),
+            'testset_name': testset_name,
+            'parent_testset': self.parent_testset_key,
+            'test_execution': str(ticket_te),
+            'testexecution_name': testexecution_name,
+            'test_plan': self.result_info.testPlanKey,
+            'test_environments': self.result_info.testEnvironments
+        })
+        test_names = [self.scenarioid_to_tescasename(el.id, el.keyword) for el in f.elements or []]
+
+        # Import Test cases
+        if import_testcase:
+            unchanged = self._unchanged(f)
+            try:
+                with metrics.phase("resolve_tests"):
+                    await self.test_index.resolve_async(test_names)
+                    exists, new = self._split_elements_to_exist_and_new(
+                        elements=f.elements,
+                        index=self.test_index,
+                        ignore_duplicate=ignore_duplicate
+                    )
+            except ValueError as e:
+                raise DuplicateValueError(f"{str(ticket_te)}:{f.uri}:{str(e)}")
+
+            tests, updated = [], 0
+            with metrics.phase("update_descriptions"):
+                for el in exists:
+                    test_name = self.scenarioid_to_tescasename(el.id, el.keyword)
+                    jira_key = self.test_index.get(test_name)[0]
+                    description = self._description(el)
+                    if test_name not in unchanged and self.test_index.description_changed(jira_key, description):
+                        await jira.update_issue_field(jira_key, fields={"description": description})
+                        self.test_index.set_description(test_name, jira_key, description)
+                        updated += 1
+                    tests.append(str(jira_key))
+            root.update({
+                'existing_tests': tests,
+                'updated_tests': updated,
+                'unchanged_tests': len(tests) - updated,
+            })
+
+            logger.info(root)
+
+            test_cases = [self._new_testcase(x, self.jira_project, ticket_ts, self.parent_testset_key) for x in new]
+            if test_cases:
+                with metrics.phase("import_tests"):
+                    imported = await test.bulk_import_chunks_async(test_cases, client, **self.bulk_import_options)
+                self.test_index.add_bulk_import(test_cases, imported.dict())
+                root.update({
+                    'import_tests_status': imported.status,
+                    'import_tests_errors': imported.result.errors,
+                })
+            self._record(f)
+
+        # Import Results
+        if import_result:
+            info = self.result_info.copy(update={
+                'summary': testexecution_name,
+                'description': self.testexecution_desc or f.description or "TBA"
+            })
+
+            with metrics.phase("aggregate_results"):
+                await self.test_index.resolve_async(test_names, refresh_missing=True)
+                _tests, _result = self._get_results(
+                    f.elements, self.test_index, ignore_duplicate, refresh_missing=False)
+            logger.debug("tests:" + str(_tests) + ", result: " + _result)
+            req = result.RequestBody(
+                info=info,
+                tests= _tests,
+                testExecutionKey=str(ticket_te)
+            )
+            root.update({'result': _result})
+            if self._pending_results is not None:
+                self._defer_results(root, req)
+                return root
+            with metrics.phase("import_results"):
+                async with locks.setdefault(str(ticket_te), asyncio.Lock()):
+                    res = await result.import_xray_json_results_async(req, client)
+            root.update({
+                'import_result_status': res.status_code,
+                'import_result_response': res.json()
+            })
+        return root
+
+    def _defer_results(self, root: dict, req: result.RequestBody) -> None:
+        with self._locks_guard:
+            self._pending_results.setdefault(req.testExecutionKey, []).append((root, req))
+
+    def _consolidated_requests(self, max_tests: int):
+        """
+        Group the deferred result imports into one request per test execution.
+
+        An execution is split into several requests only past `max_tests`
+        tests. Yields the output entries covered by each request with it.
+        """
+        pending, self._pending_results = self._pending_results or {}, None
+        for key, entries in pending.items():
+            tests = [(root, test) for root, req in entries for test in req.tests]
+            # entries without any test report the status of the first request
+            empty = [root for root, req in entries if not req.tests]
+            for i in range(0, max(len(tests), 1), max_tests):
+                chunk = tests[i:i + max_tests]
+                roots = list({id(root): root for root, _ in chunk}.values()) + (empty if i == 0 else [])
+                yield roots, result.RequestBody(
+                    info=entries[0][1].info,
+                    tests=[test for _, test in chunk],
+                    testExecutionKey=key
+                )
+
+    @staticmethod
+    def _apply_consolidated(roots: list, res) -> None:
+        response = res.json()
+        for root in roots:
+            # keep the first failure of a feature spread over several requests
+            if 'error' not in root and root.get('import_result_status', 200) < 300:
+                root.update({
+                    'import_result_status': res.status_code,
+                    'import_result_response': response
+                })
+
+    @staticmethod
+    def _consolidated_error(roots: list, req: result.RequestBody, e: Exception) -> None:
+        """Report a consolidated import that raised on every output entry it covers."""
+        logger.opt(exception=e).error(f"results of {req.testExecutionKey}: {e}")
+        for root in roots:
+            root.setdefault('error', str(e))
+
+    def _load_manifest(self) -> Manifest:
+        if not self.manifest_options:
+            return None
+        return Manifest(self.manifest_options['path'], fingerprint(
+            __version__, self.jira.url, self.jira_project, self.parent_testset_key, self.addional_identifier))
+
+    def _save_manifest(self, output: list) -> None:
+        """
+        Save the manifest, without the features whose import failed.
+
+        Their tests may have been deleted or moved in Jira, so the next run
+        looks them up again instead of trusting the recorded keys.
+        """
+        if self.manifest is None:
+            return
+        for root in output:
+            if 'error' in root or root.get('import_result_status', 200) >= 300:
+                self.manifest.drop(root.get('testset_name') or root['uri'].split("/")[-1])
+        self.manifest.save()
+
+    def _unchanged(self, f: cucumber.Feature) -> set:
+        """
+        Names of the scenarios of `f` unchanged since the manifest was written.
+
+        With `skip_lookups`, their recorded keys are added to the test index
+        so they are not searched in Jira.
+        """
+        if self.manifest is None:
+            return set()
+        testset_name = f.uri.split("/")[-1]
+        unchanged = set()
+        for el in f.elements or []:
+            test_name = self.scenarioid_to_tescasename(el.id, el.keyword)
+            key = self.manifest.get(testset_name, test_name, self._scenario_hash(el))
+            if key:
+                unchanged.add(test_name)
+                if self.manifest_options['skip_lookups']:
+                    self.test_index.add(test_name, Jirakey(key))
+        return unchanged
+
+    def _record(self, f: cucumber.Feature) -> None:
+        """Write the scenarios of `f` now in sync with Jira to the manifest."""
+        if self.manifest is None:
+            return
+        testset_name = f.uri.split("/")[-1]
+        elements = {self.scenarioid_to_tescasename(el.id, el.keyword): el for el in f.elements or []}
+        found = self.test_index.known(elements)
+        for test_name, el in elements.items():
+            if found[test_name]:
+                self.manifest.put(testset_name, test_name, str(found[test_name][0]), self._scenario_hash(el))
+
+    @classmethod
+    def _scenario_hash(cls, el: Element) -> str:
+        return scenario_hash(cls.scenarioid_to_tescasename(el.id, el.keyword), cls._description(el),
+                             cls._scenario_result(el))
+
+    @staticmethod
+    def _scenario_result(el: Element) -> str:
+        # the validated models keep the status case of the report, the trusted ones lowercase it
+        return "passed" if all(step.result.status.value.lower() == 'passed' for step in el.steps) else "failed"
+
+    def _execution_lock(self, testexecution_key: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._execution_locks.setdefault(testexecution_key, threading.Lock())
+        
+    
+    def create_testplan(self, testplan_name:str, testplan_desc: str) -> Jirakey:
+        """
+        This function return Jira key, create new test plan when not found.
+
+        It is idempotent, which means that call it multiple times with same input 
+        produces the same result as call it once.
+        """
+        assert testplan_name, "Test plan name cannot be None"
+        return self.jira.create_testplan(summary=testplan_name, description=testplan_desc)
+
+    @classmethod
+    def _get_results(cls, elements: Element, index: TestIndex, ignore_duplicate, refresh_missing=True):
+        test_request_obj = []
+        results = []
+        logger.info(elements)
+        if elements:
+            found = index.resolve(
+                [cls.scenarioid_to_tescasename(el.id, el.keyword) for el in elements], refresh_missing=refresh_missing)
+            for el in elements:
+                test_name = cls.scenarioid_to_tescasename(el.id, el.keyword)
+                tests = found[test_name]
+                if not tests:
+                    raise ValueError("Test not created: {}".format(test_name))
+                
+                test_key = tests[0]
+                if not ignore_duplicate:
+                    if len(tests) > 1:
+                        logger.error(test_name)
+                        logger.error(["{}".format(t) for t in tests])
+                        raise ValueError("More than 1 test key detected: ", tests, test_name)
+                        
+                agg_result = cls._scenario_result(el)
+                test_request_obj.append(result.Test(testKey=str(test_key), status=agg_result))
+                results.append(agg_result)
+            grand_result = "passed" if all(s == 'passed' for s in results) else "failed"
+        else:
+            grand_result = "failed"
+        return test_request_obj, grand_result
+
+    @classmethod
+    def _split_elements_to_exist_and_new(cls, elements: Element, index: TestIndex, ignore_duplicate):
+        found= []
+        not_found = []
+        logger.info(elements)
+        if elements:
+            found_tests = index.resolve([cls.scenarioid_to_tescasename(el.id, el.keyword) for el in elements])
+            for el in elements:
+                test_name = cls.scenarioid_to_tescasename(el.id, el.keyword)
+                logger.info("searching_test_name: " + test_name)
+
+                tests = found_tests[test_name]
+
+                if tests and not ignore_duplicate:
+                    if len(tests) > 1:
+                        logger.error(test_name)
+                        logger.error(["{}".format(t) for t in tests])
+                        raise ValueError("More than 1 test key detected: ", tests, test_name)
+                logger.info("found_in_jira: " + str(tests))
+                found.append(el) if tests else not_found.append(el)
+            
+            # check duplicate for new test
+            if not ignore_duplicate:
+                new_testnames = [cls.scenarioid_to_tescasename(el.id, el.keyword) for el in not_found]
+                duplicates = [item for item, count in Counter(new_testnames).items() if count > 1]
+                if duplicates:
+                    raise ValueError("More than 1 same test detected: ", duplicates)
+
+        return found, not_found
+    
+    @classmethod
+    def _new_testcase(
+        cls, 
+        element: Element, 
+        project_key: str, 
+        testset_key: Jirakey=None, 
+        parent_testset_key: Jirakey = None
+    ):
+        test_name = cls.scenarioid_to_tescasename(element.id, element.keyword)
+        test_sets = [str(x) for x in [testset_key, parent_testset_key] if x] if parent_testset_key else []
+        return test.CucumberTestCase(
+            fields=test.Fields(
+                summary=test_name, 
+                project=Project(key=project_key),
+                description=cls._description(element)
+            ),
+            xray_test_sets=test_sets
+        )
+    
+    @classmethod
+    def _update_description_if_exist(cls, el: Element, j: JiraX, index: TestIndex = None,
+                                     unchanged: set = frozenset())-> Tuple[Jirakey, bool]:
+        """Update the description of an existing test; return its key and whether it was rewritten."""
+        test_name = cls.scenarioid_to_tescasename(el.id, el.keyword)
+
+        jira_key = index.get(test_name) if index is not None else j.get_tests(test_name)
+        if jira_key: 
+            if test_name in unchanged:
+                return jira_key[0], False
+            description = cls._description(el)
+            if index is not None and not index.description_changed(jira_key[0], description):
+                return jira_key[0], False
+            # Update all Step Definition in the description
+            j.update_issue_field(jira_key[0], fields={"description": description})
+            if index is not None:
+                index.set_description(test_name, jira_key[0], description)
+            return jira_key[0], True
+        return None, False
+
+    @staticmethod
+    def _description(element: Element) -> str:
+        """Description of a test: one step definition per line."""
+        return "\n".join([f"{step.keyword} {step.name}" for step in element.steps])
+
+    @staticmethod
+    def scenarioid_to_tescasename(scenario_id: str, scenario_type: str):
+        translation_table = str.maketrans('+-', '  ')
+
+        if scenario_type == "Scenario Outline":
+            featurename_testname, version = scenario_id.split(";;")
+            feature_name, test_name = featurename_testname.split(";")
+            feature_name = feature_name.translate(translation_table)
+            test_name = test_name.translate(translation_table)
+
+            return f"{feature_name} :: {test_name} {version}"
+        else:
+            feature_name, test_name = scenario_id.split(";")
+            feature_name = feature_name.translate(translation_table)
+            test_name = test_name.translate(translation_table)
+
+            return f"{feature_name} :: {test_name}"
+        
\ No newline at end of file
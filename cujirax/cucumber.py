@@ -4,8 +4,9 @@
 
 from __future__ import annotations
 
+import json
 from enum import Enum
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
 from pydantic import BaseModel, constr
 
@@ -89,3 +90,55 @@ class Feature(BaseModel):
 
 class Model(BaseModel):
     __root__: List[Feature]
+
+
+def iter_raw_features(path: str, chunk_size: int = 1 << 20) -> Iterator[dict]:
+    """
+    Yield the features of a cucumber json report one at a time as dicts.
+
+    Only the feature being decoded is held in memory, so the peak memory is
+    bounded by the largest feature rather than by the size of the report.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buf, pos, eof = "", 0, False
+
+        def fill(min_size: int) -> bool:
+            nonlocal buf, pos
+            data = f.read(max(chunk_size, min_size))
+            buf, pos = buf[pos:] + data, 0
+            return bool(data)
+
+        def skip(chars: str) -> str:
+            nonlocal pos, eof
+            while True:
+                while pos < len(buf) and buf[pos] in chars:
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return buf[pos] if pos < len(buf) else ""
+                eof = not fill(0)
+
+        if skip(" \t\r\n") != "[":
+            raise ValueError(f"{path}: a cucumber report must be a json array")
+        pos += 1
+        while True:
+            token = skip(" \t\r\n,")
+            if token == "]":
+                return
+            if not token:
+                raise ValueError(f"{path}: unexpected end of file")
+            try:
+                feature, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # grow the read size with the pending text so a large feature is decoded in O(n)
+                eof = not fill(len(buf) - pos)
+                continue
+            yield feature
+
+
+def iter_features(path: str, chunk_size: int = 1 << 20) -> Iterator[Feature]:
+    """Yield the validated features of a cucumber json report one at a time."""
+    for raw in iter_raw_features(path, chunk_size):
+        yield Feature.parse_obj(raw)
@@ -0,0 +1,107 @@
+"""
+Trusted-input cucumber records.
+
+Lightweight `__slots__` counterparts of the pydantic models in
+`cujirax.cucumber`, with the same attribute names. They skip validation
+and normalize every step status to its lowercase `cucumber.Status`
+member, which makes parsing and aggregating large reports much cheaper.
+Only use them on reports produced by a cucumber formatter you trust.
+"""
+import json
+from typing import Iterator, List, Optional
+
+from cujirax.cucumber import Status, iter_raw_features
+
+_STATUSES = {s.value: Status(s.value.lower()) for s in Status}
+
+
+class Tag:
+    __slots__ = ("name", "line")
+
+    def __init__(self, name: str, line: Optional[int] = None) -> None:
+        self.name = name
+        self.line = line
+
+
+class Result:
+    __slots__ = ("status", "duration", "error_message")
+
+    def __init__(self, status: Status, duration: Optional[float] = None, error_message: Optional[str] = None) -> None:
+        self.status = status
+        self.duration = duration
+        self.error_message = error_message
+
+
+class Step:
+    __slots__ = ("keyword", "line", "name", "hidden", "result")
+
+    def __init__(self, keyword: str, line: Optional[int] = None, name: Optional[str] = None,
+                 hidden: Optional[bool] = None, result: Optional[Result] = None) -> None:
+        self.keyword = keyword
+        self.line = line
+        self.name = name
+        self.hidden = hidden
+        self.result = result
+
+
+class Element:
+    __slots__ = ("keyword", "type", "id", "line", "name", "tags", "steps")
+
+    def __init__(self, keyword: Optional[str], type: str, id: Optional[str], line: int, name: str,
+                 tags: Optional[List[Tag]] = None, steps: Optional[List[Step]] = None) -> None:
+        self.keyword = keyword
+        self.type = type
+        self.id = id
+        self.line = line
+        self.name = name
+        self.tags = tags
+        self.steps = steps
+
+
+class Feature:
+    __slots__ = ("uri", "name", "description", "keyword", "tags", "elements")
+
+    def __init__(self, uri: str, name: str, description: str = None, keyword: Optional[str] = None,
+                 tags: Optional[List[Tag]] = None, elements: Optional[List[Element]] = None) -> None:
+        self.uri = uri
+        self.name = name.replace('[', '(').replace(']', ')')
+        self.description = description
+        self.keyword = keyword
+        self.tags = tags
+        self.elements = elements
+
+
+def _tags(raw: Optional[list]) -> Optional[List[Tag]]:
+    return [Tag(t["name"], t.get("line")) for t in raw] if raw is not None else None
+
+
+def _step(raw: dict) -> Step:
+    result = raw.get("result")
+    if result is not None:
+        result = Result(_STATUSES[result["status"]], result.get("duration"), result.get("error_message"))
+    return Step(raw["keyword"], raw.get("line"), raw.get("name"), raw.get("hidden"), result)
+
+
+def _element(raw: dict) -> Element:
+    steps = raw.get("steps")
+    return Element(
+        raw.get("keyword"), raw["type"], raw.get("id"), raw["line"], raw["name"],
+        _tags(raw.get("tags")), [_step(s) for s in steps] if steps is not None else None)
+
+
+def feature_from_dict(raw: dict) -> Feature:
+    elements = raw.get("elements")
+    return Feature(
+        raw["uri"], raw["name"], raw.get("description"), raw.get("keyword"),
+        _tags(raw.get("tags")), [_element(e) for e in elements] if elements is not None else None)
+
+
+def parse_file(path: str) -> List[Feature]:
+    with open(path, encoding="utf-8") as f:
+        return [feature_from_dict(raw) for raw in json.load(f)]
+
+
+def iter_features(path: str, chunk_size: int = 1 << 20) -> Iterator[Feature]:
+    """Yield the features of a cucumber json report one at a time, without validation."""
+    for raw in iter_raw_features(path, chunk_size):
+        yield feature_from_dict(raw)
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import TYPE_CHECKING, Dict, Iterable, List
+
+from loguru import logger
+
+from cujirax.models import Jirakey
+from cujirax.store import TestStore, description_hash
+
+if TYPE_CHECKING:
+    from cujirax.jira import JiraX
+
+
+class TestIndex:
+    """
+    Run-scoped summary to Jira key index shared by the phases of `to_xray`.
+
+    Summaries are resolved through the optional persistent `TestStore`
+    first, then through bulk JQL searches. Misses are remembered as empty
+    lists so a scenario is never searched twice within one run. The index
+    is safe to share between the worker threads of one run.
+    """
+
+    fields = ["summary", "description"]
+
+    def __init__(self, jira: JiraX, store: TestStore = None) -> None:
+        self.jira = jira
+        self.store = store
+        self._keys: Dict[str, List[Jirakey]] = {}
+        self._hashes: Dict[str, str] = {}
+        self._lock = threading.RLock()
+
+    def resolve(self, summaries: Iterable[str], refresh_missing: bool = False) -> Dict[str, List[Jirakey]]:
+        """
+        Return the keys of every summary, searching Jira only for unknown ones.
+
+        :param refresh_missing: Also search again for summaries previously
+            resolved to no key, e.g. tests expected to exist after an import.
+        """
+        summaries = list(summaries)
+        unknown = self._unknown(summaries, refresh_missing)
+        if unknown and self.store:
+            cached = self._cached_keys(unknown)
+            if cached:
+                self._apply_cached(cached, list(self.jira.get_issues_by_keys(list(cached), fields=self.fields)))
+            unknown = self._unknown(unknown, refresh_missing=True)
+        if unknown:
+            self._apply_search(unknown, list(self.jira.search_issues_bulk(unknown, type="Test", fields=self.fields)))
+        return self._lookup(summaries)
+
+    async def resolve_async(self, summaries: Iterable[str], refresh_missing: bool = False) -> Dict[str, List[Jirakey]]:
+        """Same as `resolve`, for an index built on an `AsyncJiraX`."""
+        summaries = list(summaries)
+        unknown = self._unknown(summaries, refresh_missing)
+        if unknown and self.store:
+            cached = self._cached_keys(unknown)
+            if cached:
+                issues = await self.jira.get_issues_by_keys(list(cached), fields=self.fields)
+                # the store writes to disk, keep it off the event loop
+                await asyncio.to_thread(self._apply_cached, cached, issues)
+            unknown = self._unknown(unknown, refresh_missing=True)
+        if unknown:
+            issues = await self.jira.search_issues_bulk(unknown, type="Test", fields=self.fields)
+            if self.store:
+                await asyncio.to_thread(self._apply_search, unknown, issues)
+            else:
+                self._apply_search(unknown, issues)
+        return self._lookup(summaries)
+
+    def _unknown(self, summaries: List[str], refresh_missing: bool) -> List[str]:
+        with self._lock:
+            return [s for s in summaries if s not in self._keys or (refresh_missing and not self._keys[s])]
+
+    def _lookup(self, summaries: List[str]) -> Dict[str, List[Jirakey]]:
+        with self._lock:
+            return {s: list(self._keys.get(s, [])) for s in summaries}
+
+    def known(self, summaries: Iterable[str]) -> Dict[str, List[Jirakey]]:
+        """The keys already in the index for `summaries`, without searching Jira."""
+        return self._lookup(list(summaries))
+
+    def get(self, summary: str) -> List[Jirakey]:
+        return self.resolve([summary])[summary]
+
+    def add(self, summary: str, key: Jirakey, issue_id: str = None, description: str = None) -> None:
+        self._persist([self._remember(summary, key, issue_id, description)])
+
+    def _remember(self, summary: str, key: Jirakey, issue_id: str = None, description: str = None) -> tuple:
+        """Add `key` to the index; return its (summary, key, issue_id, description_hash) store row."""
+        d_hash = description_hash(description) if description is not None else None
+        with self._lock:
+            keys = self._keys.setdefault(summary, [])
+            if str(key) not in [str(k) for k in keys]:
+                keys.append(key)
+            if d_hash:
+                self._hashes[str(key)] = d_hash
+        return summary, str(key), issue_id, d_hash
+
+    def _persist(self, rows: List[tuple]) -> None:
+        if self.store:
+            self.store.put_many(self.jira.key, rows)
+
+    def description_changed(self, key: Jirakey, description: str) -> bool:
+        """True unless the description last seen on `key` is known to equal `description`."""
+        with self._lock:
+            return self._hashes.get(str(key)) != description_hash(description)
+
+    def set_description(self, summary: str, key: Jirakey, description: str) -> None:
+        """Record the description just written to `key`."""
+        self.add(summary, key, description=description)
+
+    def add_bulk_import(self, test_cases: list, status: dict) -> None:
+        """
+        Insert the tests created by `import_tests.bulk_import`.
+
+        :param test_cases: The test cases sent in the bulk import request.
+        :param status: The json body of the successful job status response.
+        """
+        result = status.get('result') or {}
+        rows = []
+        for issue in result.get('issues') or []:
+            element = issue.get('elementNumber')
+            if element is None or not issue.get('key'):
+                continue
+            fields = test_cases[element].fields
+            rows.append(self._remember(fields.summary, Jirakey(issue['key']), issue.get('id'), fields.description))
+        self._persist(rows)
+        for error in result.get('errors') or []:
+            logger.error(f"bulk import error: {error}")
+
+    def _apply_search(self, summaries: List[str], issues: List[dict]) -> None:
+        with self._lock:
+            for s in summaries:
+                self._keys[s] = []
+        self._persist([self._add_issue(issue['fields']['summary'], issue) for issue in issues])
+
+    def _cached_keys(self, summaries: List[str]) -> Dict[str, tuple]:
+        """Return the cached (summary, key, issue_id, description_hash) row of every key of `summaries`."""
+        cached = self.store.get_many(self.jira.key, summaries)
+        return {key: (summary, key, issue_id, d_hash) for summary, rows in cached.items()
+                for key, issue_id, d_hash in rows}
+
+    def _apply_cached(self, cached: Dict[str, tuple], issues: Iterable[dict]) -> None:
+        """Keep the cached keys still alive under the same summary and evict the others."""
+        alive = {issue['key']: issue for issue in issues}
+        changed = []
+        for key, (summary, *_) in cached.items():
+            issue = alive.get(key)
+            if issue is None or issue['fields'].get('summary') != summary:
+                logger.info(f"evicting stale cached test {key}: {summary}")
+                self.store.evict(self.jira.key, key)
+                continue
+            row = self._add_issue(summary, issue)
+            # most cached rows are unchanged, only write back the others
+            if row != cached[key]:
+                changed.append(row)
+        self._persist(changed)
+
+    def _add_issue(self, summary: str, issue: dict) -> tuple:
+        return self._remember(summary, Jirakey(issue['key']), issue.get('id'), issue['fields'].get('description'))
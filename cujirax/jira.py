@@ -1,35 +1,15 @@
+import asyncio
 import os
-import re
+import threading
 from atlassian import Jira
-from typing import List
-from pydantic import BaseModel
+from typing import Dict, Iterable, Iterator, List, Tuple
 from loguru import logger
+import requests
 
-class Jirakey:
-    value: str
-
-    def __init__(self, value) -> None:
-        self.value = value
-        if not re.match(r'[A-Z][A-Z0-9_]*-[1-9][0-9]*$', value):
-            raise ValueError('Invalid Jira key')
-
-    def __repr__(self) -> str:
-        return self.value
-
-
-class Project(BaseModel):
-    key: str
-
-
-class IssueType(BaseModel):
-    name: str
-
-
-class Issue(BaseModel):
-    summary: str
-    project: Project
-    issuetype: IssueType
-    description: str
+import cujirax.metrics as metrics
+import cujirax.ratelimit as ratelimit
+from cujirax.models import Issue, IssueType, Jirakey, Project
+from cujirax.retry import policy_for
 
 
 class JiraX(Jira):
@@ -43,11 +23,25 @@ class JiraX(Jira):
         jira_secret = secret or os.getenv("JIRA_SECRET")
 
         self.key = key
+        self._create_locks = {}
+        self._create_locks_guard = threading.Lock()
+        self._containers = {}
         super().__init__(
             url=f'https://{jira_domain}',
             username=jira_email,
             password=jira_secret)
-        
+        # at the session level, so the attempts retried by Jira.request itself are recorded and limited too
+        self._session.request = ratelimit.limited(metrics.timed("jira", self._session.request))
+
+
+    def request(self, *args, advanced_mode: bool = False, **kwargs):
+        """Retry throttled (429/503) and transient failures of every Jira call with backoff, only rejected writes."""
+        policy = policy_for(kwargs.get("method", args[0] if args else "GET"),
+                            (requests.ConnectTimeout,), (requests.ConnectionError, requests.Timeout))
+        response = policy.call(super().request, *args, advanced_mode=True, **kwargs)
+        if not (self.advanced_mode or advanced_mode):
+            self.raise_for_status(response)
+        return response
 
     def get_testsets(self, summary: str) -> List[Jirakey]:
         return self.get_issues(summary=summary, type="Test Set")
@@ -58,20 +52,81 @@ class JiraX(Jira):
     def get_tests(self, summary: str) -> List[Jirakey]:
         return self.get_issues(summary=summary, type="Test")
 
-    def get_issues(self, summary: str, type: str, labels: List[str] = []) -> List[Jirakey]:
-        # filter out problematic strings in summary
+    def get_tests_bulk(self, summaries: Iterable[str], batch_size: int = 50) -> Dict[str, List[Jirakey]]:
+        """
+        Resolve many test summaries with a few paged JQL searches.
+
+        Summaries are OR-ed together in batches of `batch_size`, and the
+        candidates returned by Jira are matched on their exact summary on
+        the client side. Summaries without any match map to an empty list.
+        """
+        found = {summary: [] for summary in summaries}
+        for issue in self.search_issues_bulk(list(found), type="Test", batch_size=batch_size):
+            found[issue['fields']['summary']].append(Jirakey(issue.get('key')))
+        return found
+
+    def search_issues_bulk(self, summaries: List[str], type: str, fields: List[str] = ["summary"],
+                           batch_size: int = 50) -> Iterator[dict]:
+        """Yield the raw issues of `type` whose summary is exactly one of `summaries`."""
+        wanted = set(summaries)
+        for query in self._bulk_queries(summaries, type, batch_size):
+            for issue in self.jql_paged(query, fields=fields):
+                if issue.get('fields', {}).get('summary') in wanted:
+                    yield issue
+
+    def _bulk_queries(self, summaries: List[str], type: str, batch_size: int) -> Iterator[str]:
+        scope = f'issuetype="{type}" AND project="{self.key}"'
+        clauses = [self._summary_clause(s) for s in dict.fromkeys(summaries)]
+        if not all(clauses):
+            # a summary without any searchable word (e.g. "login_page.feature") can only be found
+            # by listing every issue of the type, matched on the exact summary by the caller
+            yield scope
+            return
+        for i in range(0, len(clauses), batch_size):
+            yield f'{scope} AND ({" OR ".join(sorted(set(clauses[i:i + batch_size])))})'
+
+    def get_issues_by_keys(self, keys: List[str], fields: List[str] = ["summary"],
+                           batch_size: int = 100) -> Iterator[dict]:
+        """Yield the raw issues that still exist among `keys`, one `key in (...)` search per batch."""
+        for i in range(0, len(keys), batch_size):
+            query = f'key in ({", ".join(keys[i:i + batch_size])})'
+            # "warn" makes Jira skip deleted keys instead of rejecting the whole query
+            yield from self.jql_paged(query, fields=fields, validate_query="warn")
+
+    def jql_paged(self, query: str, fields: List[str] = ["summary"], page_size: int = 100,
+                  validate_query: str = None) -> Iterator[dict]:
+        """Yield every issue matching `query`, following the search pagination."""
+        logger.debug(f"query: '{query}'")
+        start = 0
+        while True:
+            page = self.jql(query, fields=fields, start=start, limit=page_size, validate_query=validate_query)
+            issues = page.get("issues") or []
+            yield from issues
+            start += len(issues)
+            if not issues or start >= page.get("total", 0):
+                return
+
+    @staticmethod
+    def _summary_clause(summary: str) -> str:
+        # blank out the characters JQL text search chokes on, the other words still narrow the search
+        special_chars = ['$', '%', '^', '&', '*', '#', '_', '[', ']', '"', '\\']
+        words = "".join(" " if char in special_chars else char for char in summary).split()
+        # Jira rejects an empty text search, callers fall back to listing the issues
+        return f'summary~"{" ".join(words)}"' if words else ""
+
+    def _issues_query(self, summary: str, type: str, labels: List[str] = []) -> str:
         if labels:
             labels = [f"labels='{l}'" for l in labels]
-            query = f'issuetype="{type}" AND project="{self.key}" AND {" AND ".join(labels)}'
-        else:
-            special_chars = ['$', '%', '^', '&', '*', '#', '_', '[',']']
-            tokens = _summary.split(" ")
-            new_tokens = [t for t in tokens if all(char not in special_chars for char in t)]
-            _summary = " ".join(new_tokens)
-            query = f'issuetype="{type}" AND summary~"{_summary}" AND project="{self.key}"'
-        logger.debug(f"query: '{query}'")
-        issues = self.jql(query).get("issues")
-        
+            return f'issuetype="{type}" AND project="{self.key}" AND {" AND ".join(labels)}'
+        clause = self._summary_clause(summary)
+        if not clause:
+            return f'issuetype="{type}" AND project="{self.key}"'
+        return f'issuetype="{type}" AND {clause} AND project="{self.key}"'
+
+    def get_issues(self, summary: str, type: str, labels: List[str] = []) -> List[Jirakey]:
+        query = self._issues_query(summary, type, labels)
+        issues = self.jql_paged(query)
+
         return [Jirakey(issue.get('key')) for issue in issues if issue.get('fields')['summary'] == summary]
 
     def link(self, parent_jira: str, child_jira: str, type="Parents"):
@@ -96,26 +151,85 @@ class JiraX(Jira):
             "outwardIssue": {"key": str(Jirakey(parent_jira))}
         })
 
+    def reset_containers(self) -> None:
+        """Forget the test sets, executions and plans resolved so far, e.g. at the start of a run."""
+        with self._create_locks_guard:
+            self._containers = {}
+
+    @staticmethod
+    def _container_id(summary: str, issue_type: str, labels: List[str]) -> tuple:
+        return issue_type, summary, tuple(labels)
+
     def _create(self, summary: str, description: str, issue_type: str, labels: List[str]) -> Jirakey:
+        labels = [l for l in labels if l]
+        container_id = self._container_id(summary, issue_type, labels)
+        # serialize the search-then-create of the same issue across worker threads
+        with self._create_locks_guard:
+            lock = self._create_locks.setdefault(container_id, threading.Lock())
+        with lock:
+            if container_id not in self._containers:
+                self._containers[container_id] = self._search_or_create(summary, description, issue_type, labels)
+            return self._containers[container_id]
+
+    def _search_or_create(self, summary: str, description: str, issue_type: str, labels: List[str]) -> Jirakey:
         issue = self.get_issues(summary, issue_type, labels)
         if issue:
-            self.update_issue_field
-            jira_key = issue[0]
-            return jira_key
+            return issue[0]
 
         issue = Issue(
             summary=summary,
             project=Project(key=self.key),
             issuetype=IssueType(name=issue_type),
-            description=description)
-        
-        response = self.create_issue(fields=issue.dict())
+            description=description,
+            labels=labels or None)
         
-        key = Jirakey(response.get('key'))
-        logger.info(f"updating label {labels} to: {key.value}")
-        self.issue_update(key.value, fields={"labels": labels})
+        response = self.create_issue(fields=issue.dict(exclude_none=True))
+        return Jirakey(response.get('key'))
+
+    def create_containers_bulk(self, issues: List[Tuple[str, str]], issue_type: str,
+                               batch_size: int = 50) -> Dict[str, Jirakey]:
+        """
+        Resolve many unlabelled containers of `issue_type` at once.
+
+        `issues` are (summary, description) pairs; the first description of
+        a summary wins. Summaries not resolved yet are searched with a few
+        bulk JQL queries, and the missing ones are created with Jira's bulk
+        create endpoint, `batch_size` (at most 50) issues per request.
+        """
+        wanted = {}
+        for summary, description in issues:
+            wanted.setdefault(summary, description)
+        found = {s: self._containers[self._container_id(s, issue_type, [])]
+                 for s in wanted if self._container_id(s, issue_type, []) in self._containers}
 
-        return key
+        for issue in self.search_issues_bulk([s for s in wanted if s not in found], type=issue_type):
+            found.setdefault(issue['fields']['summary'], Jirakey(issue.get('key')))
+
+        missing = [s for s in wanted if s not in found]
+        for i in range(0, len(missing), batch_size):
+            batch = missing[i:i + batch_size]
+            logger.info(f"creating {len(batch)} {issue_type} issue(s)")
+            response = self.create_issues([
+                {"fields": Issue(
+                    summary=summary,
+                    project=Project(key=self.key),
+                    issuetype=IssueType(name=issue_type),
+                    description=wanted[summary]).dict(exclude_none=True)}
+                for summary in batch])
+            failed = {e.get('failedElementNumber') for e in response.get('errors') or []}
+            for error in response.get('errors') or []:
+                logger.error(f"{issue_type} {batch[error.get('failedElementNumber')]}: {error.get('elementErrors')}")
+            created = [s for n, s in enumerate(batch) if n not in failed]
+            for summary, issue in zip(created, response.get('issues') or []):
+                found[summary] = Jirakey(issue.get('key'))
+
+        with self._create_locks_guard:
+            for summary, key in found.items():
+                self._containers.setdefault(self._container_id(summary, issue_type, []), key)
+        return found
+
+    def create_testsets_bulk(self, issues: List[Tuple[str, str]]) -> Dict[str, Jirakey]:
+        return self.create_containers_bulk(issues, "Test Set")
 
     def create_testset(self, summary: str, description: str, labels: List[str] = []) -> Jirakey:
         return self._create(summary, description, "Test Set", labels)
@@ -125,3 +239,132 @@ class JiraX(Jira):
 
     def create_testplan(self, summary: str, description: str, labels: List[str] = []) -> Jirakey:
         return self._create(summary, description, "Test Plan", labels)
+
+
+class AsyncJiraX:
+    """
+    Non-blocking counterpart of the `JiraX` calls used by `CuJiraX.to_xray_async`.
+
+    Requires the optional `httpx` dependency. At most `max_connections`
+    requests are in flight at once.
+    """
+
+    def __init__(self, key: str, url: str, username: str, password: str, max_connections: int = 20):
+        import httpx
+
+        self.key = key
+        self.url = url
+        self.client = httpx.AsyncClient(
+            base_url=url,
+            auth=(username, password),
+            headers={"Accept": "application/json"},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(120, connect=10))
+        self._create_locks = {}
+        self._containers = {}
+
+    @classmethod
+    def from_jira(cls, jira: JiraX, max_connections: int = 20) -> "AsyncJiraX":
+        return cls(jira.key, jira.url, jira.username, jira.password, max_connections)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def _request(self, method: str, url: str, **kwargs):
+        import httpx
+
+        policy = policy_for(method, (httpx.ConnectError, httpx.ConnectTimeout), (httpx.TransportError,))
+        send = ratelimit.limited_async(metrics.timed_async("jira", self.client.request), self.url)
+        response = await policy.call_async(send, method, url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    _summary_clause = staticmethod(JiraX._summary_clause)
+    _bulk_queries = JiraX._bulk_queries
+    _issues_query = JiraX._issues_query
+    _container_id = staticmethod(JiraX._container_id)
+
+    async def jql(self, query: str, fields: List[str] = ["summary"], start: int = 0, limit: int = None,
+                  validate_query: str = None) -> dict:
+        params = {"jql": query, "fields": ",".join(fields), "startAt": start}
+        if limit is not None:
+            params["maxResults"] = limit
+        if validate_query is not None:
+            params["validateQuery"] = validate_query
+        response = await self._request("GET", "/rest/api/2/search", params=params)
+        return response.json()
+
+    async def jql_paged(self, query: str, fields: List[str] = ["summary"], page_size: int = 100,
+                        validate_query: str = None) -> List[dict]:
+        logger.debug(f"query: '{query}'")
+        found = []
+        while True:
+            page = await self.jql(query, fields=fields, start=len(found), limit=page_size,
+                                  validate_query=validate_query)
+            issues = page.get("issues") or []
+            found.extend(issues)
+            if not issues or len(found) >= page.get("total", 0):
+                return found
+
+    async def search_issues_bulk(self, summaries: List[str], type: str, fields: List[str] = ["summary"],
+                                 batch_size: int = 50) -> List[dict]:
+        wanted = set(summaries)
+        pages = await asyncio.gather(*[
+            self.jql_paged(query, fields=fields) for query in self._bulk_queries(summaries, type, batch_size)])
+        return [issue for page in pages for issue in page if issue.get('fields', {}).get('summary') in wanted]
+
+    async def get_issues_by_keys(self, keys: List[str], fields: List[str] = ["summary"],
+                                 batch_size: int = 100) -> List[dict]:
+        pages = await asyncio.gather(*[
+            self.jql_paged(f'key in ({", ".join(keys[i:i + batch_size])})', fields=fields, validate_query="warn")
+            for i in range(0, len(keys), batch_size)])
+        return [issue for page in pages for issue in page]
+
+    async def get_tests_bulk(self, summaries: Iterable[str], batch_size: int = 50) -> Dict[str, List[Jirakey]]:
+        found = {summary: [] for summary in summaries}
+        for issue in await self.search_issues_bulk(list(found), type="Test", batch_size=batch_size):
+            found[issue['fields']['summary']].append(Jirakey(issue.get('key')))
+        return found
+
+    async def get_issues(self, summary: str, type: str, labels: List[str] = []) -> List[Jirakey]:
+        issues = await self.jql_paged(self._issues_query(summary, type, labels))
+        return [Jirakey(issue.get('key')) for issue in issues if issue.get('fields')['summary'] == summary]
+
+    async def create_issue(self, fields: dict) -> dict:
+        response = await self._request("POST", "/rest/api/2/issue", json={"fields": fields})
+        return response.json()
+
+    async def update_issue_field(self, key: Jirakey, fields: dict) -> None:
+        await self._request("PUT", f"/rest/api/2/issue/{key}", json={"fields": fields})
+
+    async def _create(self, summary: str, description: str, issue_type: str, labels: List[str]) -> Jirakey:
+        labels = [l for l in labels if l]
+        container_id = self._container_id(summary, issue_type, labels)
+        async with self._create_locks.setdefault(container_id, asyncio.Lock()):
+            if container_id not in self._containers:
+                self._containers[container_id] = await self._search_or_create(
+                    summary, description, issue_type, labels)
+            return self._containers[container_id]
+
+    async def _search_or_create(self, summary: str, description: str, issue_type: str,
+                                labels: List[str]) -> Jirakey:
+        issue = await self.get_issues(summary, issue_type, labels)
+        if issue:
+            return issue[0]
+
+        response = await self.create_issue(Issue(
+            summary=summary,
+            project=Project(key=self.key),
+            issuetype=IssueType(name=issue_type),
+            description=description,
+            labels=labels or None).dict(exclude_none=True))
+        return Jirakey(response.get('key'))
+
+    async def create_testset(self, summary: str, description: str, labels: List[str] = []) -> Jirakey:
+        return await self._create(summary, description, "Test Set", labels)
+
+    async def create_testexecution(self, summary: str, description: str, labels: List[str] = []) -> Jirakey:
+        return await self._create(summary, description, "Test Execution", labels)
+
+    async def create_testplan(self, summary: str, description: str, labels: List[str] = []) -> Jirakey:
+        return await self._create(summary, description, "Test Plan", labels)
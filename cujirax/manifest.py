@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict
+
+from loguru import logger
+
+
+def fingerprint(*parts) -> str:
+    """Hash of everything a manifest depends on; a different fingerprint invalidates it."""
+    return hashlib.sha1(json.dumps(parts, default=str).encode("utf-8")).hexdigest()
+
+
+def scenario_hash(summary: str, description: str, result: str) -> str:
+    return hashlib.sha1(json.dumps([summary, description, result]).encode("utf-8")).hexdigest()
+
+
+class Manifest:
+    """
+    Local JSON manifest of the scenarios synced by previous runs.
+
+    Entries map a test set and a test summary to the hash of the scenario
+    (summary, step definitions and result) and its test key. The whole
+    manifest is discarded when it was written with another `fingerprint`,
+    e.g. for another project or parent test set, or by another version.
+    """
+
+    version = 1
+
+    def __init__(self, path: str, fingerprint: str) -> None:
+        self.path = path
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, list]] = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable manifest {self.path}: {e}")
+            return {}
+        if data.get("version") != self.version or data.get("fingerprint") != self.fingerprint:
+            logger.info(f"Manifest {self.path} was written for another configuration, starting over")
+            return {}
+        return data.get("entries") or {}
+
+    def get(self, testset: str, summary: str, content_hash: str) -> str:
+        """Return the test key recorded for an unchanged scenario, None if it is new or changed."""
+        with self._lock:
+            entry = self._entries.get(testset, {}).get(summary)
+        return entry[1] if entry and entry[0] == content_hash else None
+
+    def put(self, testset: str, summary: str, key: str, content_hash: str) -> None:
+        with self._lock:
+            self._entries.setdefault(testset, {})[summary] = [content_hash, key]
+
+    def drop(self, testset: str) -> None:
+        """Forget every scenario of `testset`, so the next run looks them up again."""
+        with self._lock:
+            self._entries.pop(testset, None)
+
+    def save(self) -> None:
+        """Write the manifest atomically, so an interrupted run leaves the previous one intact."""
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with self._lock:
+            data = {"version": self.version, "fingerprint": self.fingerprint, "entries": self._entries}
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logger.warning(f"Unable to write manifest {self.path}: {e}")
@@ -0,0 +1,154 @@
+"""
+Phase timers and API call counters.
+
+`collect()` opens a scope in the current context (thread or asyncio task);
+every `phase`, request and retry recorded while it is open is added to its
+`Metrics`, and to the metrics of the enclosing scopes. `set_hook` forwards
+the same spans to another backend. With no open scope and no hook, the
+instrumentation points return right away.
+"""
+import contextvars
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+
+# hook(name, seconds, attributes), called for every phase and request
+Hook = Callable[[str, float, dict], None]
+
+_scopes: contextvars.ContextVar[Tuple["Metrics", ...]] = contextvars.ContextVar("cujirax_metrics", default=())
+_hook: Optional[Hook] = None
+
+
+class Metrics:
+    """Timings and counters of one scope; safe to update from several threads."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.phases = {}
+        self.requests = {}
+        self.counters = Counter()
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        with self._lock:
+            phase = self.phases.setdefault(name, {"count": 0, "seconds": 0.0})
+            phase["count"] += 1
+            phase["seconds"] += seconds
+
+    def add_request(self, endpoint: str, status: int, seconds: float, sent: int, received: int) -> None:
+        with self._lock:
+            request = self.requests.setdefault(endpoint, {"count": 0, "seconds": 0.0, "status": Counter()})
+            request["count"] += 1
+            request["seconds"] += seconds
+            request["status"][status] += 1
+            self.counters.update(requests=1, bytes_sent=sent, bytes_received=received, throttled=status == 429)
+
+    def increment(self, counter: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[counter] += value
+
+    def dict(self) -> dict:
+        with self._lock:
+            return {
+                "phases": {name: {**p, "seconds": round(p["seconds"], 6)} for name, p in self.phases.items()},
+                "endpoints": {
+                    endpoint: {**r, "seconds": round(r["seconds"], 6), "status": dict(r["status"])}
+                    for endpoint, r in self.requests.items()},
+                **{c: self.counters[c] for c in ("requests", "retries", "throttled", "bytes_sent", "bytes_received")},
+            }
+
+
+def set_hook(hook: Optional[Hook]) -> None:
+    """Forward every phase and request span to `hook`; None disables it."""
+    global _hook
+    _hook = hook
+
+
+def enabled() -> bool:
+    return _hook is not None or bool(_scopes.get())
+
+
+@contextmanager
+def collect() -> Iterator[Metrics]:
+    """Collect the metrics of the code run in this context until the block exits."""
+    metrics = Metrics()
+    token = _scopes.set(_scopes.get() + (metrics,))
+    try:
+        yield metrics
+    finally:
+        _scopes.reset(token)
+
+
+@contextmanager
+def phase(name: str, **attributes) -> Iterator[None]:
+    """Time the block as one occurrence of the phase `name`."""
+    if not enabled():
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        for metrics in _scopes.get():
+            metrics.add_phase(name, seconds)
+        if _hook is not None:
+            _hook(name, seconds, attributes)
+
+
+def bind(func: Callable) -> Callable:
+    """Run `func` in copies of the current context, so calls from worker threads are collected too."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+
+def increment(counter: str, value: int = 1) -> None:
+    for metrics in _scopes.get():
+        metrics.increment(counter, value)
+
+
+def endpoint(service: str, method: str, url: str) -> str:
+    """e.g. "jira GET /rest/api/2/issue/{id}", with issue keys and job ids replaced."""
+    path = re.sub(r"[A-Z][A-Z0-9_]*-[0-9]+|[0-9a-f]{16,}", "{id}", urlparse(str(url)).path)
+    return f"{service} {method.upper()} {path}"
+
+
+def record_request(service: str, response, seconds: float) -> None:
+    """Record one HTTP attempt from its (requests or httpx) response."""
+    if not enabled():
+        return
+    name = endpoint(service, response.request.method, response.request.url)
+    sent = int(response.request.headers.get("Content-Length") or 0)
+    received = int(response.headers.get("Content-Length") or len(response.content))
+    for metrics in _scopes.get():
+        metrics.add_request(name, response.status_code, seconds, sent, received)
+    if _hook is not None:
+        _hook("http", seconds, {
+            "endpoint": name, "status": response.status_code, "bytes_sent": sent, "bytes_received": received})
+
+
+def timed(service: str, send: Callable) -> Callable:
+    """Wrap the HTTP call `send` so every attempt is recorded."""
+    def wrapper(*args, **kwargs):
+        if not enabled():
+            return send(*args, **kwargs)
+        started = time.perf_counter()
+        response = send(*args, **kwargs)
+        record_request(service, response, time.perf_counter() - started)
+        return response
+    return wrapper
+
+
+def timed_async(service: str, send: Callable) -> Callable:
+    """Same as `timed` for a coroutine function."""
+    async def wrapper(*args, **kwargs):
+        if not enabled():
+            return await send(*args, **kwargs)
+        started = time.perf_counter()
+        response = await send(*args, **kwargs)
+        record_request(service, response, time.perf_counter() - started)
+        return response
+    return wrapper
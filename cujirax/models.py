@@ -0,0 +1,35 @@
+"""
+Jira issue models, importable without the Jira client and atlassian.
+"""
+import re
+from typing import List
+
+from pydantic import BaseModel
+
+
+class Jirakey:
+    value: str
+
+    def __init__(self, value) -> None:
+        self.value = value
+        if not re.match(r'[A-Z][A-Z0-9_]*-[1-9][0-9]*$', value):
+            raise ValueError('Invalid Jira key')
+
+    def __repr__(self) -> str:
+        return self.value
+
+
+class Project(BaseModel):
+    key: str
+
+
+class IssueType(BaseModel):
+    name: str
+
+
+class Issue(BaseModel):
+    summary: str
+    project: Project
+    issuetype: IssueType
+    description: str
+    labels: List[str] = None
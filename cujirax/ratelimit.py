@@ -0,0 +1,213 @@
+"""
+Client-side rate limit of the Jira and Xray calls.
+
+`RateLimiter` keeps a token bucket per host. Its rate adapts to the
+answers (AIMD): it is cut by `decrease` on a 429/503 and the host is paused
+for the Retry-After delay, then it grows back by about `increase` requests
+per second, for every second the limit is reached without being throttled.
+With `path`, the buckets live in that file, locked with fcntl, so parallel
+processes share one allowance per host.
+
+The limiter is process-wide, see `set_limiter`, or set CUJIRAX_RATE_LIMIT
+(requests per second) and optionally CUJIRAX_RATE_LIMIT_FILE.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+from loguru import logger
+
+import cujirax.metrics as metrics
+from cujirax.retry import retry_after
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class RateLimiter:
+    """Token bucket per host, with AIMD rate adjustment; safe to use from several threads."""
+
+    def __init__(
+            self,
+            rate: float = 10,
+            burst: float = None,
+            min_rate: float = 0.5,
+            max_rate: float = None,
+            increase: float = 1,
+            decrease: float = 0.7,
+            cooldown: float = 1,
+            throttle_statuses: tuple = (429, 503),
+            path: str = None,
+    ) -> None:
+        """
+        :param rate: Initial requests per second of every host.
+        :param burst: Requests sent at once after an idle period, one second of `rate` by default.
+        :param min_rate: The rate is never cut below it.
+        :param max_rate: The rate never grows above it, unbounded by default.
+        :param increase: Requests per second added for each second spent at the limit.
+        :param decrease: Factor applied to the rate when a request is throttled.
+        :param cooldown: Seconds during which further throttled answers do not cut the rate again.
+        :param throttle_statuses: Statuses that mean the host is throttling us.
+        :param path: File shared by the processes limiting the same hosts.
+        """
+        if path and fcntl is None:
+            logger.warning(f"File locks are not supported here, {path} is not used: the limit is per process")
+            path = None
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.throttle_statuses = throttle_statuses
+        self.path = path
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _state(self) -> Iterator[Dict[str, dict]]:
+        """The buckets of every host, read and written back under the file lock when shared."""
+        with self._lock:
+            if not self.path:
+                yield self._hosts
+                return
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            with os.fdopen(fd, "r+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    try:
+                        hosts = json.loads(f.read() or "{}")
+                    except ValueError:
+                        hosts = {}
+                    yield hosts
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(hosts, f)
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _bucket(self, hosts: Dict[str, dict], host: str, now: float) -> dict:
+        bucket = hosts.setdefault(host, {"rate": self.rate, "tokens": 0.0, "updated": 0.0, "cut": 0.0})
+        # `updated` is in the future while the host is paused
+        if now > bucket["updated"]:
+            burst = self.burst or max(1.0, bucket["rate"])
+            bucket["tokens"] = min(burst, bucket["tokens"] + (now - bucket["updated"]) * bucket["rate"])
+            bucket["updated"] = now
+        return bucket
+
+    def reserve(self, host: str) -> float:
+        """Take a token for one request to `host`; return how long to wait before sending it."""
+        now = time.time()
+        with self._state() as hosts:
+            bucket = self._bucket(hosts, host, now)
+            delay = bucket["updated"] - now + max(0.0, 1 - bucket["tokens"]) / bucket["rate"]
+            bucket["tokens"] -= 1
+        return delay
+
+    def wait(self, host: str) -> None:
+        delay = self.reserve(host)
+        if delay > 0:
+            with metrics.phase("rate_limit", host=host):
+                time.sleep(delay)
+
+    async def wait_async(self, host: str) -> None:
+        delay = await self._off_loop(self.reserve, host)
+        if delay > 0:
+            with metrics.phase("rate_limit", host=host):
+                await asyncio.sleep(delay)
+
+    def feedback(self, host: str, status: int, pause: float = None) -> None:
+        """
+        Adjust the rate of `host` to the answer of a request.
+
+        :param status: HTTP status of the answer.
+        :param pause: Seconds to wait before the next request, from Retry-After.
+        """
+        now = time.time()
+        with self._state() as hosts:
+            bucket = self._bucket(hosts, host, now)
+            if status in self.throttle_statuses:
+                if now - bucket["cut"] >= self.cooldown:
+                    bucket["rate"] = max(self.min_rate, bucket["rate"] * self.decrease)
+                    bucket["cut"] = now
+                    logger.info(f"Throttled by {host}, rate limit down to {bucket['rate']:.2f}/s")
+                bucket["tokens"] = min(0.0, bucket["tokens"])
+                if pause:
+                    bucket["updated"] = max(bucket["updated"], now + pause)
+            elif bucket["tokens"] < 1:
+                # only grow a rate that is actually limiting
+                rate = bucket["rate"] + self.increase / bucket["rate"]
+                bucket["rate"] = min(self.max_rate, rate) if self.max_rate else rate
+
+    async def feedback_async(self, host: str, status: int, pause: float = None) -> None:
+        await self._off_loop(self.feedback, host, status, pause)
+
+    async def _off_loop(self, func: Callable, *args):
+        # another process may hold the file lock, do not block the event loop waiting for it
+        if self.path:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    def rates(self) -> Dict[str, float]:
+        """Current requests per second of every host seen so far."""
+        with self._state() as hosts:
+            return {host: bucket["rate"] for host, bucket in hosts.items()}
+
+
+def _from_env() -> Optional[RateLimiter]:
+    rate = os.getenv("CUJIRAX_RATE_LIMIT")
+    return RateLimiter(float(rate), path=os.getenv("CUJIRAX_RATE_LIMIT_FILE")) if rate else None
+
+
+limiter: Optional[RateLimiter] = _from_env()
+
+
+def set_limiter(new: Optional[RateLimiter]) -> None:
+    """Rate limit every Jira and Xray request with `new`; None disables it."""
+    global limiter
+    limiter = new
+
+
+def _host(args: tuple, kwargs: dict, base_url: str = None) -> str:
+    url = base_url or kwargs.get("url") or next(a for a in args if isinstance(a, str) and "://" in a)
+    return urlparse(str(url)).netloc
+
+
+def limited(send: Callable, base_url: str = None) -> Callable:
+    """
+    Wrap the HTTP call `send` so every attempt goes through the `limiter`.
+
+    :param base_url: URL of the host, when `send` is called with relative URLs.
+    """
+    def wrapper(*args, **kwargs):
+        current = limiter
+        if current is None:
+            return send(*args, **kwargs)
+        host = _host(args, kwargs, base_url)
+        current.wait(host)
+        response = send(*args, **kwargs)
+        current.feedback(host, response.status_code, retry_after(response))
+        return response
+    return wrapper
+
+
+def limited_async(send: Callable, base_url: str = None) -> Callable:
+    """Same as `limited` for a coroutine function."""
+    async def wrapper(*args, **kwargs):
+        current = limiter
+        if current is None:
+            return await send(*args, **kwargs)
+        host = _host(args, kwargs, base_url)
+        await current.wait_async(host)
+        response = await send(*args, **kwargs)
+        await current.feedback_async(host, response.status_code, retry_after(response))
+        return response
+    return wrapper
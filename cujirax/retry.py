@@ -0,0 +1,217 @@
+import asyncio
+import email.utils
+import functools
+import random
+import time
+from typing import Callable, Iterator, Tuple, Type
+
+import requests
+from loguru import logger
+
+import cujirax.metrics as metrics
+
+
+class RetryableError(Exception):
+    """Raise to ask a `RetryPolicy` for another attempt, optionally after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: float = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PollTimeout(Exception):
+    """Raised when `RetryPolicy.poll` reaches its deadline."""
+    pass
+
+
+def retry_after(response) -> float:
+    """Seconds requested by the Retry-After header of `response`, if any."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        # malformed header, fall back to the normal backoff
+        return None
+    return max(0.0, date.timestamp() - time.time()) if date else None
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with jitter, Retry-After support and an overall deadline.
+
+    Responses whose status is in `retry_statuses` and exceptions listed in
+    `retry_exceptions` (or `RetryableError`) are retried; anything else is
+    fatal and returned or raised as is.
+    """
+
+    def __init__(
+            self,
+            max_attempts: int = 5,
+            base_delay: float = 0.5,
+            max_delay: float = 30,
+            multiplier: float = 2,
+            jitter: float = 0.25,
+            deadline: float = None,
+            retry_statuses: Tuple[int, ...] = (429, 502, 503, 504),
+            retry_exceptions: Tuple[Type[BaseException], ...] = (requests.ConnectionError, requests.Timeout),
+    ) -> None:
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.deadline = deadline
+        self.retry_statuses = retry_statuses
+        self.retry_exceptions = retry_exceptions
+
+    def copy(self, **kwargs) -> "RetryPolicy":
+        policy = RetryPolicy.__new__(RetryPolicy)
+        policy.__dict__.update({**self.__dict__, **kwargs})
+        return policy
+
+    def delays(self) -> Iterator[float]:
+        """Backoff delays between attempts, with +/- `jitter` proportional randomization."""
+        delay = self.base_delay
+        while True:
+            yield min(self.max_delay, delay) * random.uniform(1 - self.jitter, 1 + self.jitter)
+            delay *= self.multiplier
+
+    def is_retryable(self, error: BaseException) -> bool:
+        if isinstance(error, RetryableError):
+            return True
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response.status_code in self.retry_statuses
+        return isinstance(error, self.retry_exceptions)
+
+    def _wait(self, attempt: int, delays: Iterator[float], started: float, reason, hint: float = None) -> float:
+        """Return how long to sleep before the next attempt, or None when giving up."""
+        delay = next(delays)
+        if hint is not None:
+            delay = max(delay, hint)
+        if attempt >= self.max_attempts:
+            return None
+        if self.deadline is not None and time.monotonic() + delay - started > self.deadline:
+            return None
+        logger.info(f"Retry {attempt}/{self.max_attempts} in {delay:.2f}s - {reason}")
+        metrics.increment("retries")
+        return delay
+
+    def _outcome(self, func: Callable, args, kwargs):
+        """Classify one attempt as (result, error, retry_after hint, retryable)."""
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            hint = getattr(e, "retry_after", None)
+            if hint is None and isinstance(e, requests.HTTPError):
+                hint = retry_after(e.response)
+            return None, e, hint, self.is_retryable(e)
+        status = getattr(result, "status_code", None)
+        if status in self.retry_statuses:
+            return result, None, retry_after(result), True
+        return result, None, None, False
+
+    def call(self, func: Callable, *args, **kwargs):
+        """Call `func` until it succeeds, fails fatally or the policy gives up."""
+        started, delays = time.monotonic(), self.delays()
+        for attempt in range(1, self.max_attempts + 1):
+            result, error, hint, retryable = self._outcome(func, args, kwargs)
+            delay = self._wait(attempt, delays, started, error or f"HTTP {result.status_code}", hint) \
+                if retryable else None
+            if delay is None:
+                if error is not None:
+                    raise error
+                return result
+            time.sleep(delay)
+
+    async def call_async(self, func: Callable, *args, **kwargs):
+        """Same as `call` for a coroutine function."""
+        started, delays = time.monotonic(), self.delays()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                result, error, hint = await func(*args, **kwargs), None, None
+                retryable = getattr(result, "status_code", None) in self.retry_statuses
+                hint = retry_after(result) if retryable else None
+            except Exception as e:
+                result, error, hint, retryable = None, e, getattr(e, "retry_after", None), self.is_retryable(e)
+            delay = self._wait(attempt, delays, started, error or f"HTTP {result.status_code}", hint) \
+                if retryable else None
+            if delay is None:
+                if error is not None:
+                    raise error
+                return result
+            await asyncio.sleep(delay)
+
+    def poll(self, func: Callable, done: Callable, *args, **kwargs):
+        """
+        Call `func` until `done(result)` is true, backing off between calls.
+
+        Transient errors count as "not done yet". Raises `PollTimeout` when
+        the attempts or the deadline are exhausted.
+        """
+        started, delays = time.monotonic(), self.delays()
+        for attempt in range(1, self.max_attempts + 1):
+            result, error, hint, retryable = self._outcome(func, args, kwargs)
+            if error is not None and not retryable:
+                raise error
+            if error is None and not retryable and done(result):
+                return result
+            delay = self._wait(attempt, delays, started, error or "not done", hint)
+            if delay is None:
+                break
+            time.sleep(delay)
+        raise PollTimeout(f"{getattr(func, '__name__', func)} not done after {attempt} attempts")
+
+    async def poll_async(self, func: Callable, done: Callable, *args, **kwargs):
+        """Same as `poll` for a coroutine function."""
+        started, delays = time.monotonic(), self.delays()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                result, error = await func(*args, **kwargs), None
+                retryable = getattr(result, "status_code", None) in self.retry_statuses
+                hint = retry_after(result) if retryable else None
+            except Exception as e:
+                result, error, hint, retryable = None, e, getattr(e, "retry_after", None), self.is_retryable(e)
+                if not retryable:
+                    raise
+            if error is None and not retryable and done(result):
+                return result
+            delay = self._wait(attempt, delays, started, error or "not done", hint)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+        raise PollTimeout(f"{getattr(func, '__name__', func)} not done after {attempt} attempts")
+
+    def __call__(self, func: Callable) -> Callable:
+        """Use the policy as a decorator."""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+        return wrapper
+
+
+# Idempotent reads and rejected writes (429/503 are answered before any work is done)
+http_policy = RetryPolicy(max_attempts=5, base_delay=1, max_delay=60, deadline=300)
+
+# The only statuses of a non-GET request that are safe to retry: a 502/504 may
+# come from a gateway after the request was processed
+REJECTED_STATUSES = (429, 503)
+
+
+def policy_for(method: str, connect_errors: Tuple[Type[BaseException], ...],
+               transient_errors: Tuple[Type[BaseException], ...]) -> RetryPolicy:
+    """
+    `http_policy` for one HTTP call: a GET is retried on any `transient_errors`,
+    anything else only when it was rejected or never sent (`connect_errors`).
+    """
+    if method.upper() == "GET":
+        return http_policy.copy(retry_exceptions=transient_errors)
+    return http_policy.copy(retry_statuses=REJECTED_STATUSES, retry_exceptions=connect_errors)
+
+# Waiting for asynchronous Xray jobs: start fast, slow down for long jobs
+poll_policy = RetryPolicy(max_attempts=1000, base_delay=0.25, max_delay=5, multiplier=1.5, deadline=600)
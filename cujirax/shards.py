@@ -0,0 +1,72 @@
+"""
+Merge the cucumber reports written by parallel test runners.
+"""
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Union
+
+from loguru import logger
+
+import cujirax.cucumber as cucumber
+import cujirax.cucumber_fast as cucumber_fast
+
+
+def is_multi_shard(cucumber_json: Union[str, List[str]]) -> bool:
+    return not isinstance(cucumber_json, (str, os.PathLike)) or glob.has_magic(str(cucumber_json))
+
+
+def expand_paths(cucumber_json: Union[str, List[str]]) -> List[str]:
+    """Expand a glob or a list of paths/globs into a sorted, de-duplicated list of files."""
+    patterns = [cucumber_json] if isinstance(cucumber_json, (str, os.PathLike)) else cucumber_json
+    paths = []
+    for pattern in map(str, patterns):
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        paths.extend(p for p in matches if p not in paths)
+    if not paths:
+        raise ValueError(f"No cucumber report found for {cucumber_json}")
+    return paths
+
+
+def parse_file(path: str, trusted_input: bool = False) -> list:
+    if trusted_input:
+        return cucumber_fast.parse_file(path)
+    return cucumber.Model.parse_file(path).__root__
+
+
+def merge_features(features: list) -> list:
+    """
+    Merge features sharing the same `uri` and drop repeated scenarios.
+
+    The first occurrence of a scenario (same type and id) wins; shards are
+    merged in the order given.
+    """
+    merged = {}
+    seen = {}
+    for f in features:
+        target = merged.get(f.uri)
+        if target is None:
+            target = merged[f.uri] = f
+            candidates, target.elements = f.elements or [], []
+            seen[f.uri] = set()
+        else:
+            candidates = f.elements or []
+        for el in candidates:
+            key = (el.type, el.id)
+            if el.id is not None and key in seen[f.uri]:
+                logger.debug(f"dropping duplicate scenario {el.id} of {f.uri}")
+                continue
+            seen[f.uri].add(key)
+            target.elements.append(el)
+    return list(merged.values())
+
+
+def load_shards(cucumber_json: Union[str, List[str]], trusted_input: bool = False, max_workers: int = None) -> list:
+    """Parse every shard on a process pool and return the merged features."""
+    paths = expand_paths(cucumber_json)
+    logger.info(f"merging {len(paths)} cucumber report(s)")
+    if len(paths) == 1:
+        return merge_features(parse_file(paths[0], trusted_input))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        shards = list(pool.map(parse_file, paths, [trusted_input] * len(paths)))
+    return merge_features([f for shard in shards for f in shard])
@@ -0,0 +1,79 @@
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+
+def description_hash(description: str) -> str:
+    """Hash a description the same way whatever line endings Jira returns."""
+    text = (description or "").replace("\r\n", "\n").strip()
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class TestStore:
+    """
+    Persistent SQLite cache of project + summary to test issue key/id.
+
+    Entries are only hints: `TestIndex` validates them against Jira before
+    use and evicts the ones whose issue was deleted or renamed.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tests (
+                    project TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    issue_id TEXT,
+                    description_hash TEXT,
+                    PRIMARY KEY (project, summary, key)
+                )
+                """
+            )
+
+    def get_many(self, project: str, summaries: Iterable[str]) -> Dict[str, List[Tuple[str, str, str]]]:
+        """Return the cached (key, issue_id, description_hash) rows of every summary found."""
+        found = {}
+        summaries = list(summaries)
+        with self._lock:
+            for i in range(0, len(summaries), 500):
+                chunk = summaries[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT summary, key, issue_id, description_hash FROM tests "
+                    f"WHERE project = ? AND summary IN ({','.join('?' * len(chunk))})",
+                    [project, *chunk],
+                ).fetchall()
+                for summary, key, issue_id, d_hash in rows:
+                    found.setdefault(summary, []).append((key, issue_id, d_hash))
+        return found
+
+    def put(self, project: str, summary: str, key: str, issue_id: str = None, d_hash: str = None) -> None:
+        self.put_many(project, [(summary, key, issue_id, d_hash)])
+
+    def put_many(self, project: str, rows: Iterable[Tuple[str, str, str, str]]) -> None:
+        """Upsert (summary, key, issue_id, description_hash) rows in one transaction."""
+        rows = [(project, *row) for row in rows]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            # rows already up to date are left untouched
+            self._conn.executemany(
+                "INSERT INTO tests VALUES (?, ?, ?, ?, ?) ON CONFLICT (project, summary, key) DO UPDATE SET "
+                "issue_id = COALESCE(excluded.issue_id, issue_id), "
+                "description_hash = COALESCE(excluded.description_hash, description_hash) "
+                "WHERE COALESCE(excluded.issue_id, issue_id) IS NOT issue_id "
+                "OR COALESCE(excluded.description_hash, description_hash) IS NOT description_hash",
+                rows,
+            )
+
+    def evict(self, project: str, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM tests WHERE project = ? AND key = ?", (project, key))
+
+    def close(self) -> None:
+        self._conn.close()
@@ -1,12 +1,21 @@
+import asyncio
+import base64
 from enum import Enum
+import hashlib
 import json
-from typing import List, Union, AnyStr
+from typing import List, Tuple, Union, AnyStr
 from loguru import logger
 from pydantic import BaseModel, Field
 import os
 import requests
+import requests.adapters
+import cujirax.metrics as metrics
+import cujirax.ratelimit as ratelimit
+from cujirax.retry import RetryPolicy, policy_for
+import threading
 import time
-import functools
+import uuid
+import weakref
 
 
 xray_url = "https://xray.cloud.getxray.app"
@@ -17,7 +26,61 @@ class Endpoint(Enum):
     AUTHENTICATE = "/api/v2/authenticate"
     CHECK_IMPORT_TEST_STATUS = "/api/v2/import/test/bulk/{}/status"
     IMPORT_XRAY_JSON_RESULTS = "/api/v2/import/execution"
-    GRAPHQL = "/api/v1/graphql"
+    IMPORT_CUCUMBER_MULTIPART = "/api/v2/import/execution/cucumber/multipart"
+    GRAPHQL = "/api/v2/graphql"
+
+
+class SessionConfig(BaseModel):
+    pool_size: int = 10
+    connect_timeout: float = 10
+    read_timeout: float = 120
+
+
+_session_config = SessionConfig()
+_session = None
+_session_lock = threading.Lock()
+
+
+def configure_session(**kwargs) -> SessionConfig:
+    """
+    Change the pool size or timeouts of the shared Xray session.
+
+    The session is rebuilt lazily on the next request.
+    """
+    global _session_config, _session
+    with _session_lock:
+        _session_config = _session_config.copy(update=kwargs)
+        if _session is not None:
+            _session.close()
+            _session = None
+    return _session_config
+
+
+def session() -> requests.Session:
+    """
+    Return the keep-alive session shared by every Xray call.
+
+    The underlying urllib3 pool is thread safe, so the session can be used
+    from several worker threads at once.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=_session_config.pool_size,
+                pool_maxsize=_session_config.pool_size)
+            _session = requests.Session()
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """Send through the shared session, retrying 429/5xx answers and transient errors."""
+    kwargs.setdefault("timeout", (_session_config.connect_timeout, _session_config.read_timeout))
+    send = ratelimit.limited(metrics.timed("xray", session().request))
+    policy = policy_for(method, (requests.ConnectTimeout,), (requests.ConnectionError, requests.Timeout))
+    return policy.call(send, method, url, **kwargs)
 
 
 class Header(BaseModel):
@@ -31,57 +94,289 @@ class Authentication(BaseModel):
 
 
 def retry(max_retries=3, delay=1):
-    def decorator_retry(func):
-        @functools.wraps(func)
-        def wrapper_retry(*args, **kwargs):
-            retries = 0
-            while retries < max_retries:
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    retries += 1
-                    print(f"Retry {retries}/{max_retries} - Error: {e}")
-                    time.sleep(delay)
-            raise Exception(f"Failed after {max_retries} retries")
-        return wrapper_retry
-    return decorator_retry
-
-
-@retry(max_retries=5, delay=2)
-def login()-> Header:
-    header = Header()
-    response = post(Endpoint.AUTHENTICATE.value, Authentication(), header)
+    """Retry any exception with exponential backoff starting at `delay` seconds."""
+    return RetryPolicy(max_attempts=max_retries, base_delay=delay, retry_exceptions=(Exception,))
+
+
+class TokenProvider:
+    """
+    Cache the Xray bearer token in memory and refresh it shortly before expiry.
+
+    When `cache_path` is given, the token is also shared through that file so
+    parallel processes (e.g. CI shards) authenticate only once.
+    """
+
+    def __init__(self, cache_path: str = None, refresh_margin: int = 300, default_ttl: int = 3600) -> None:
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self.default_ttl = default_ttl
+        self._token = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+        self._async_locks = weakref.WeakKeyDictionary()
+
+    def token(self, force: bool = False) -> str:
+        with self._lock:
+            if not force and self._cached():
+                return self._token
+            self._set(authenticate())
+            return self._token
+
+    async def token_async(self, client, force: bool = False) -> str:
+        """Like `token`, authenticating through the httpx.AsyncClient `client`."""
+        with self._lock:
+            if not force and self._cached():
+                return self._token
+        # one refresh at a time, the coroutines waiting for it reuse its token
+        async with self._async_lock():
+            with self._lock:
+                if not force and self._cached():
+                    return self._token
+            token = await authenticate_async(client)
+            with self._lock:
+                self._set(token)
+                return self._token
+
+    def _async_lock(self) -> asyncio.Lock:
+        # an asyncio.Lock belongs to one event loop, e.g. one per asyncio.run
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            return self._async_locks.setdefault(loop, asyncio.Lock())
+
+    def _cached(self) -> bool:
+        return self._valid(self._expires) or self._read_cache()
+
+    def _set(self, token: str) -> None:
+        self._token = token
+        self._expires = self._expiry(token)
+        self._write_cache()
+
+    def invalidate(self, token: str) -> None:
+        """Forget `token` after a 401, unless another thread already replaced it."""
+        with self._lock:
+            if token == self._token:
+                self._expires = 0.0
+
+    def _valid(self, expires: float) -> bool:
+        return expires - self.refresh_margin > time.time()
+
+    def _expiry(self, token: str) -> float:
+        try:
+            claims = token.split(".")[1]
+            claims += "=" * (-len(claims) % 4)
+            return float(json.loads(base64.urlsafe_b64decode(claims))["exp"])
+        except (IndexError, KeyError, TypeError, ValueError):
+            return time.time() + self.default_ttl
+
+    def _cache_id(self) -> str:
+        return hashlib.sha1(f"{xray_url}|{Authentication().client_id}".encode()).hexdigest()
+
+    def _read_cache(self) -> bool:
+        if not self.cache_path:
+            return False
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if cached.get("id") != self._cache_id() or cached.get("token") == self._token \
+                or not self._valid(cached.get("expires", 0)):
+            return False
+        self._token, self._expires = cached["token"], cached["expires"]
+        return True
+
+    def _write_cache(self) -> None:
+        if not self.cache_path:
+            return
+        tmp = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump({"id": self._cache_id(), "token": self._token, "expires": self._expires}, f)
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Unable to write token cache {self.cache_path}: {e}")
+
+
+token_provider = TokenProvider(cache_path=os.getenv("XRAY_TOKEN_CACHE"))
+
+
+def authenticate() -> str:
+    response = post(Endpoint.AUTHENTICATE.value, Authentication(), Header())
     if response.status_code == 200:
-        header.Authorization = "Bearer " + eval(response.text)
-        return header
+        return response.json()
     raise Exception("Authentication error: Invalid credentials")
 
-def post(endpoint: str, payload: Union[BaseModel, List[BaseModel], AnyStr], headers: Header)-> requests.Response:
-    url = f"{xray_url}{endpoint}"
+
+def login(force: bool = False) -> Header:
+    with metrics.phase("login"):
+        return Header(Authorization="Bearer " + token_provider.token(force))
+
+
+async def authenticate_async(client) -> str:
+    response = await post_async(Endpoint.AUTHENTICATE.value, Authentication(), Header(), client)
+    if response.status_code == 200:
+        return response.json()
+    raise Exception("Authentication error: Invalid credentials")
+
+
+async def login_async(client, force: bool = False) -> Header:
+    with metrics.phase("login"):
+        return Header(Authorization="Bearer " + await token_provider.token_async(client, force))
+
+
+def _reauthenticate(headers: Header) -> bool:
+    """Refresh the bearer token of `headers` after a 401; False if there is none to refresh."""
+    if not headers.Authorization or not headers.Authorization.startswith("Bearer "):
+        return False
+    token_provider.invalidate(headers.Authorization[len("Bearer "):])
+    headers.Authorization = login().Authorization
+    return True
+
+class MultipartBody:
+    """
+    A multipart/form-data body streamed part by part.
+
+    Each part is a (name, filename, content) tuple where content is either
+    bytes or the path of a file read from disk in `chunk_size` blocks. The
+    body can be iterated several times, so a retried request sends it again
+    from the start.
+    """
+
+    def __init__(self, parts: List[Tuple[str, str, Union[bytes, str]]], chunk_size: int = 1 << 16) -> None:
+        self.parts = parts
+        self.chunk_size = chunk_size
+        self.boundary = uuid.uuid4().hex
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def _head(self, name: str, filename: str) -> bytes:
+        return (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: application/json\r\n\r\n"
+        ).encode()
+
+    def __len__(self) -> int:
+        size = len(f"--{self.boundary}--\r\n")
+        for name, filename, content in self.parts:
+            size += len(self._head(name, filename)) + len(b"\r\n")
+            size += len(content) if isinstance(content, bytes) else os.path.getsize(content)
+        return size
+
+    def __iter__(self):
+        for name, filename, content in self.parts:
+            yield self._head(name, filename)
+            if isinstance(content, bytes):
+                yield content
+            else:
+                with open(content, "rb") as f:
+                    while chunk := f.read(self.chunk_size):
+                        yield chunk
+            yield b"\r\n"
+        yield f"--{self.boundary}--\r\n".encode()
+
+
+def _serialize(payload: Union[BaseModel, List[BaseModel], AnyStr, MultipartBody]) -> Union[AnyStr, MultipartBody]:
+    if isinstance(payload, (bytes, MultipartBody)):
+        return payload
     if isinstance(payload, list):
         _payload = [p.dict(by_alias=True, exclude_none=True) for p in payload]
-        _payload = json.dumps(_payload)
-        # print("payload", _payload)
+        return json.dumps(_payload)
     elif isinstance(payload, str): 
         logger.info("is string type")
-        _payload = payload
-    else:
-        _payload = payload.json(by_alias=True, exclude_none=True)
+        return payload
+    return payload.json(by_alias=True, exclude_none=True)
+
+
+def post(endpoint: str, payload: Union[BaseModel, List[BaseModel], AnyStr, MultipartBody], headers: Header)-> requests.Response:
+    url = f"{xray_url}{endpoint}"
+    _payload = _serialize(payload)
 
     parameters = {
         "url": url,
-        "method": "POST", 
+        "method": "POST",
         "headers": headers.dict(by_alias=True, exclude_none=True),
         "data": _payload
     }
     
-    response = requests.request(**parameters)
+    response = request(**parameters)
+    if response.status_code == 401 and _reauthenticate(headers):
+        parameters["headers"] = headers.dict(by_alias=True, exclude_none=True)
+        response = request(**parameters)
     return response
 
 def get(endpoint: str, headers: Header, payload: str= None) -> requests.Response:
     url = f"{xray_url}{endpoint}"
     logger.info(f"GET '{url}'")
-    return requests.get(
+    response = request(
+        "GET",
         url=url, 
         data=payload,
         headers=headers.dict(by_alias=True, exclude_none=True),)
+    if response.status_code == 401 and _reauthenticate(headers):
+        response = request(
+            "GET",
+            url=url,
+            data=payload,
+            headers=headers.dict(by_alias=True, exclude_none=True),)
+    return response
+
+
+def async_client(max_connections: int = None):
+    """
+    Build an httpx.AsyncClient for the `*_async` helpers.
+
+    Requires the optional `httpx` dependency (`pip install cujirax[async]`).
+    """
+    import httpx
+
+    max_connections = max_connections or _session_config.pool_size
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        timeout=httpx.Timeout(_session_config.read_timeout, connect=_session_config.connect_timeout))
+
+
+async def post_async(endpoint: str, payload: Union[BaseModel, List[BaseModel], AnyStr], headers: Header, client):
+    url = f"{xray_url}{endpoint}"
+    parameters = {
+        "url": url,
+        "content": _serialize(payload),
+        "headers": headers.dict(by_alias=True, exclude_none=True),
+    }
+    response = await _async_policy("POST").call_async(_async_send(client.post), **parameters)
+    if response.status_code == 401 and await _reauthenticate_async(headers, client):
+        parameters["headers"] = headers.dict(by_alias=True, exclude_none=True)
+        response = await _async_policy("POST").call_async(_async_send(client.post), **parameters)
+    return response
+
+
+async def get_async(endpoint: str, headers: Header, client):
+    url = f"{xray_url}{endpoint}"
+    logger.info(f"GET '{url}'")
+    response = await _async_policy("GET").call_async(
+        _async_send(client.get), url, headers=headers.dict(by_alias=True, exclude_none=True))
+    if response.status_code == 401 and await _reauthenticate_async(headers, client):
+        response = await _async_policy("GET").call_async(
+            _async_send(client.get), url, headers=headers.dict(by_alias=True, exclude_none=True))
+    return response
+
+
+def _async_send(send):
+    return ratelimit.limited_async(metrics.timed_async("xray", send))
+
+
+def _async_policy(method: str) -> RetryPolicy:
+    import httpx
+
+    return policy_for(method, (httpx.ConnectError, httpx.ConnectTimeout), (httpx.TransportError,))
+
+
+async def _reauthenticate_async(headers: Header, client) -> bool:
+    if not headers.Authorization or not headers.Authorization.startswith("Bearer "):
+        return False
+    token_provider.invalidate(headers.Authorization[len("Bearer "):])
+    headers.Authorization = (await login_async(client)).Authorization
+    return True
@@ -1,39 +1,113 @@
+import functools
 import json
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Tuple
 from loguru import logger
-from jinja2 import Template
-from cujirax.xray import login
-from retrying import retry
-from graphqlclient import GraphQLClient
+import cujirax.metrics as metrics
+from cujirax.retry import RetryPolicy
+from cujirax.xray import Endpoint, login, post
 
 from cujirax.xray.import_results import Status
 
+# mutation name: (argument holding the added ids, field listing what was added)
+ADD_MUTATIONS = {
+    'addTestsToTestSet': ('testIssueIds', 'addedTests'),
+    'addTestsToTestPlan': ('testIssueIds', 'addedTests'),
+    'addTestsToTestExecution': ('testIssueIds', 'addedTests'),
+    'addTestExecutionsToTestPlan': ('testExecIssueIds', 'addedTestExecutions'),
+}
+
+# name: GraphQL document builder, see `operation`
+OPERATIONS: Dict[str, Callable[..., str]] = {}
+
+
+def chunks(items: list, chunk_size: int) -> List[list]:
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def operation(build: Callable[..., str]) -> Callable[..., str]:
+    """
+    Register a GraphQL document builder in `OPERATIONS`.
+
+    Values are passed as GraphQL variables, so a document only depends on
+    the builder arguments. Each distinct document is built and compacted
+    once per process, then reused as is.
+    """
+    @functools.lru_cache(maxsize=None)
+    @functools.wraps(build)
+    def compiled(*args) -> str:
+        return " ".join(build(*args).split())
+
+    OPERATIONS[build.__name__] = compiled
+    return compiled
+
+
+@operation
+def issue_ids(method: str) -> str:
+    return '''
+        query ($jql: String!, $limit: Int!, $start: Int) {
+            %s(jql: $jql, limit: $limit, start: $start) {
+                total
+                results {
+                    issueId
+                    jira(fields: ["key"])
+                }
+            }
+        }
+    ''' % method
+
+
+@operation
+def add_mutations(fields: Tuple[Tuple[str, str], ...]) -> str:
+    """`ADD_MUTATIONS` run as (alias, mutation name) fields, the i-th one reading $issueId<i> and $ids<i>."""
+    variables = ", ".join(f"$issueId{i}: String!, $ids{i}: [String]!" for i in range(len(fields)))
+    body = "\n".join(
+        f"{alias}: {name}(issueId: $issueId{i}, {ADD_MUTATIONS[name][0]}: $ids{i}) "
+        f"{{ {ADD_MUTATIONS[name][1]} warning }}"
+        for i, (alias, name) in enumerate(fields)
+    )
+    return f"mutation ({variables}) {{ {body} }}"
+
+
+@operation
+def update_testrun_status() -> str:
+    return '''
+        mutation ($id: String!, $status: String!) {
+            updateTestRunStatus(id: $id, status: $status)
+        }
+    '''
+
 
 class TMS():
 
-    def __init__(self, testplan_key: str):
+    def __init__(self, testplan_key: str, cache_size: int = 4096):
         """
         Initialize the TMS instance with authentication and test plan details.
 
         :param testplan_key: Key for the test plan.
+        :param cache_size: Number of issue key to ID mappings kept in memory.
         """
         self.header = login()
+        self.cache_size = cache_size
+        self._issue_ids = OrderedDict()
+        self._cache_lock = threading.Lock()
         self.testplan_key = testplan_key
-        self.client = GraphQLClient(
-            'https://xray.cloud.getxray.app/api/v2/graphql')
-        self.client.inject_token(self.header.Authorization)
         self.testplan_id = self.fetch_issue_id('getTestPlans', testplan_key)
 
-    def run_graphql_query(self, query_template, **kwargs) -> dict:
+    def run_graphql_query(self, query: str, variables: dict = None) -> dict:
         """
         Execute a GraphQL query with specified parameters.
 
-        :param query_template: A Jinja template string for the GraphQL query.
-        :param kwargs: Arguments to render in the Jinja template.
+        :param query: A GraphQL document, usually from one of the `OPERATIONS`.
+        :param variables: Values of the variables declared by the document.
         :return: The 'data' portion of the GraphQL response.
         """
-        query = Template(query_template).render(**kwargs)
-        logger.info(query)
-        result = json.loads(self.client.execute(query))
+        logger.info(f"{query} {variables}")
+        payload = {"query": query, "variables": variables or {}}
+        with metrics.phase("graphql"):
+            response = post(Endpoint.GRAPHQL.value, json.dumps(payload), login())
+            result = response.json()
 
         if 'errors' in result:
             logger.error(result['errors'])
@@ -42,6 +116,34 @@ class TMS():
         logger.info(result)
         return result['data']
 
+    def _add(self, name: str, issue_id: str, ids: List[str]) -> dict:
+        return self.run_graphql_query(
+            add_mutations(((name, name),)),
+            {"issueId0": issue_id, "ids0": ids}
+        )
+
+    def run_mutations(self, mutations: List[Tuple[str, str, List[str]]], max_fields: int = 10) -> List[dict]:
+        """
+        Run several `ADD_MUTATIONS` as aliased fields of a single request.
+
+        :param mutations: (mutation name, target issue id, ids to add) tuples.
+        :param max_fields: Maximum number of mutations sent in one request.
+        :return: The result of each mutation, in order; warnings are logged.
+        """
+        results = []
+        for batch in chunks(mutations, max_fields):
+            document = add_mutations(tuple((f"m{i}", name) for i, (name, _, _) in enumerate(batch)))
+            variables = {}
+            for i, (_, issue_id, ids) in enumerate(batch):
+                variables.update({f"issueId{i}": issue_id, f"ids{i}": list(ids)})
+            data = self.run_graphql_query(document, variables)
+            for i, (name, issue_id, _) in enumerate(batch):
+                result = data[f"m{i}"]
+                if result.get('warning'):
+                    logger.warning(f"{name} {issue_id}: {result['warning']}")
+                results.append(result)
+        return results
+
     def fetch_issue_id(self, method: str, key: str) -> str:
         """
         Retrieve an issue ID based on a specified method and key.
@@ -50,20 +152,61 @@ class TMS():
         :param key: The key associated with the issue.
         :return: The issue ID.
         """
+        issue_id = self._cached_issue_id(key)
+        if issue_id is not None:
+            return issue_id
         logger.info(f"Fetching issue id by key: {key} using method: {method}")
-        query_template = '''
-            {
-                {{ method }}(jql: "key={{ key }}", limit: 1) {
-                    results {
-                        issueId
-                    }
-                }
-            }
-        '''
-        result = self.run_graphql_query(query_template, method=method, key=key)
-        return result[method]['results'][0]['issueId']
+        result = self.run_graphql_query(issue_ids(method), {"jql": f"key={key}", "limit": 1, "start": 0})
+        issue_id = result[method]['results'][0]['issueId']
+        self._cache_issue_id(key, issue_id)
+        return issue_id
+
+    def fetch_issue_ids(self, method: str, keys: Iterable[str], page_size: int = 100) -> Dict[str, str]:
+        """
+        Retrieve the issue IDs of many keys, `page_size` keys per query.
+
+        :param method: The GraphQL method to use for retrieving the issue IDs.
+        :param keys: The keys associated with the issues.
+        :param page_size: Number of keys per query, at most 100.
+        :return: The issue ID of every key.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {key: self._cached_issue_id(key) for key in keys}
+        missing = [key for key, issue_id in found.items() if issue_id is None]
+        for chunk in chunks(missing, page_size):
+            logger.info(f"Fetching {len(chunk)} issue ids using method: {method}")
+            variables = {"jql": f"key in ({', '.join(chunk)})", "limit": page_size, "start": 0}
+            while True:
+                page = self.run_graphql_query(issue_ids(method), variables)[method]
+                for issue in page['results']:
+                    found[issue['jira']['key']] = issue['issueId']
+                    self._cache_issue_id(issue['jira']['key'], issue['issueId'])
+                variables["start"] += len(page['results'])
+                if not page['results'] or variables["start"] >= page['total']:
+                    break
+
+        not_found = [key for key in keys if found.get(key) is None]
+        if not_found:
+            raise KeyError(f"Issues not found with {method}: {not_found}")
+        return found
+
+    def _cached_issue_id(self, key: str) -> str:
+        with self._cache_lock:
+            issue_id = self._issue_ids.get(key)
+            if issue_id is not None:
+                self._issue_ids.move_to_end(key)
+            return issue_id
 
-    @retry(stop_max_attempt_number=10, wait_fixed=5000)
+    def _cache_issue_id(self, key: str, issue_id: str) -> None:
+        with self._cache_lock:
+            self._issue_ids[key] = issue_id
+            self._issue_ids.move_to_end(key)
+            while len(self._issue_ids) > self.cache_size:
+                self._issue_ids.popitem(last=False)
+
+    # a new test plan can take a few seconds to become visible to Xray
+    @RetryPolicy(max_attempts=10, base_delay=1, max_delay=10, deadline=60,
+                 retry_exceptions=(IndexError, KeyError, TypeError))
     def fetch_testplan_id(self, key) -> str:
         """
         Retrieve a test plan ID based on its key.
@@ -81,21 +224,10 @@ class TMS():
         :param testset_key: The key of the test set.
         :return: The result of the mutation.
         """
-        mutation_template = '''
-            mutation {
-                addTestsToTestSet(
-                    issueId: "{{ testset_id }}",
-                    testIssueIds: ["{{ test_id }}"]
-                ) {
-                    addedTests
-                    warning
-                }
-            }
-        '''
-        return self.run_graphql_query(
-            mutation_template,
-            testset_id=self.fetch_issue_id('getTestSets', testset_key),
-            test_id=self.fetch_issue_id('getTests', test_key)
+        return self._add(
+            'addTestsToTestSet',
+            self.fetch_issue_id('getTestSets', testset_key),
+            [self.fetch_issue_id('getTests', test_key)]
         )
 
     def assign_tests_to_plan(self, test_id: str, testplan_id: str) -> dict:
@@ -106,22 +238,7 @@ class TMS():
         :param testplan_id: The ID of the test plan.
         :return: The result of the mutation.
         """
-        mutation_template = '''
-            mutation {
-                addTestsToTestPlan(
-                    issueId: "{{ testplan_id }}",
-                    testIssueIds: ["{{ test_id }}"]
-                ) {
-                    addedTests
-                    warning
-                }
-            }
-        '''
-        return self.run_graphql_query(
-            mutation_template,
-            testplan_id=testplan_id,
-            test_id=test_id
-        )
+        return self._add('addTestsToTestPlan', testplan_id, [test_id])
 
     def assign_tests_to_execution(self, test_id: str, test_execution: str) -> dict:
         """
@@ -131,23 +248,52 @@ class TMS():
         :param test_execution: The key of the test execution.
         :return: The result of the mutation.
         """
-        mutation_template = '''
-            mutation {
-                addTestsToTestExecution(
-                    issueId: "{{ te_id }}",
-                    testIssueIds: ["{{ test_id }}"]
-                ) {
-                    addedTests
-                    warning
-                }
-            }
-        '''
-        return self.run_graphql_query(
-            mutation_template,
-            te_id=self.fetch_issue_id('getTestExecutions', test_execution),
-            test_id=test_id
+        return self._add(
+            'addTestsToTestExecution',
+            self.fetch_issue_id('getTestExecutions', test_execution),
+            [test_id]
         )
 
+    def add_tests_to_testset(self, test_keys: List[str], testset_key: str, chunk_size: int = 100) -> List[dict]:
+        """
+        Add tests to a test set, `chunk_size` tests per mutation.
+
+        :param test_keys: The keys of the tests.
+        :param testset_key: The key of the test set.
+        :param chunk_size: Number of tests added by each mutation.
+        :return: The result of each mutation.
+        """
+        testset_id = self.fetch_issue_id('getTestSets', testset_key)
+        found = self.fetch_issue_ids('getTests', test_keys)
+        test_ids = [found[key] for key in test_keys]
+        return self.run_mutations(
+            [('addTestsToTestSet', testset_id, ids) for ids in chunks(test_ids, chunk_size)])
+
+    def add_tests_to_plan(self, test_ids: List[str], testplan_id: str, chunk_size: int = 100) -> List[dict]:
+        """
+        Add tests to a test plan, `chunk_size` tests per mutation.
+
+        :param test_ids: The IDs of the tests.
+        :param testplan_id: The ID of the test plan.
+        :param chunk_size: Number of tests added by each mutation.
+        :return: The result of each mutation.
+        """
+        return self.run_mutations(
+            [('addTestsToTestPlan', testplan_id, ids) for ids in chunks(test_ids, chunk_size)])
+
+    def add_tests_to_execution(self, test_ids: List[str], test_execution: str, chunk_size: int = 100) -> List[dict]:
+        """
+        Add tests to a test execution, `chunk_size` tests per mutation.
+
+        :param test_ids: The IDs of the tests.
+        :param test_execution: The key of the test execution.
+        :param chunk_size: Number of tests added by each mutation.
+        :return: The result of each mutation.
+        """
+        te_id = self.fetch_issue_id('getTestExecutions', test_execution)
+        return self.run_mutations(
+            [('addTestsToTestExecution', te_id, ids) for ids in chunks(test_ids, chunk_size)])
+
     def set_testrun_status(self, testrun_id: str, status: str):
         """
         Update the status of a test run.
@@ -156,18 +302,9 @@ class TMS():
         :param status: The new status to set.
         :return: The result of the mutation.
         """
-        mutation_template = '''
-            mutation {
-                updateTestRunStatus(
-                    id: "{{ testrun_id }}",
-                    status: "{{ status }}"
-                )
-            }
-        '''
         return self.run_graphql_query(
-            mutation_template,
-            testrun_id=testrun_id,
-            status=Status[status]
+            update_testrun_status(),
+            {"id": testrun_id, "status": Status[status].value}
         )
 
     def assign_execution_to_plan(self, testexecution_id: str):
@@ -177,19 +314,4 @@ class TMS():
         :param testexecution_id: The ID of the test execution.
         :return: The result of the mutation.
         """
-        mutation_template = '''
-            mutation {
-                addTestExecutionsToTestPlan(
-                    issueId: "{{ testplan_id }}",
-                    testExecIssueIds: ["{{ testexecution_id }}"]
-                ) {
-                    addedTestExecutions
-                    warning
-                }
-            }
-        '''
-        return self.run_graphql_query(
-            mutation_template,
-            testplan_id=self.testplan_id,
-            testexecution_id=testexecution_id
-        )
+        return self._add('addTestExecutionsToTestPlan', self.testplan_id, [testexecution_id])
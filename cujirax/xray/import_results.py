@@ -1,7 +1,8 @@
 from enum import Enum
-from typing import List
+from typing import List, Union
 from pydantic import BaseModel
-from cujirax.xray import Endpoint, login, post
+from cujirax.models import IssueType, Project
+from cujirax.xray import Endpoint, MultipartBody, login, login_async, post, post_async
 
 
 class Status(str, Enum):
@@ -65,6 +66,25 @@ class RequestBody(BaseModel):
     testExecutionKey: str = None
 
 
+class ExecutionFields(BaseModel):
+    project: Project
+    summary: str
+    description: str = None
+    issuetype: IssueType = IssueType(name="Test Execution")
+    labels: List[str] = None
+
+
+class XrayFields(BaseModel):
+    testPlanKey: str = None
+    environments: List[str] = None
+
+
+class CucumberInfo(BaseModel):
+    """The `info` part of a cucumber multipart import: the fields of the Test Execution to create."""
+    fields: ExecutionFields
+    xrayFields: XrayFields = None
+
+
 def import_xray_json_results(requestBody: RequestBody):
     header = login()
     response = post(
@@ -73,3 +93,33 @@ def import_xray_json_results(requestBody: RequestBody):
         headers=header
     )
     return response
+
+
+async def import_xray_json_results_async(requestBody: RequestBody, client):
+    header = await login_async(client)
+    return await post_async(
+        endpoint=Endpoint.IMPORT_XRAY_JSON_RESULTS.value,
+        payload=requestBody,
+        headers=header,
+        client=client
+    )
+
+
+def import_cucumber_multipart(results: Union[str, bytes], info: CucumberInfo):
+    """
+    Import a cucumber json report through Xray's native cucumber endpoint.
+
+    `results` is the path of the report, streamed from disk, or the report
+    itself as bytes. Xray matches the scenarios to their tests server-side.
+    """
+    body = MultipartBody([
+        ("results", "results.json", results),
+        ("info", "info.json", info.json(by_alias=True, exclude_none=True).encode()),
+    ])
+    header = login()
+    header.Content_Type = body.content_type
+    return post(
+        endpoint=Endpoint.IMPORT_CUCUMBER_MULTIPART.value,
+        payload=body,
+        headers=header
+    )
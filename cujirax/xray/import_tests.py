@@ -1,12 +1,16 @@
+import asyncio
 import time
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import List
+from typing import Dict, List
 
 from pydantic import BaseModel
 from requests import Response
 
-from cujirax.jira import Project
-from cujirax.xray import Endpoint, get, login, post
+import cujirax.metrics as metrics
+from cujirax.models import Project
+from cujirax.retry import poll_policy
+from cujirax.xray import Endpoint, get, get_async, login, login_async, post, post_async
 
 from loguru import logger
 
@@ -61,22 +65,230 @@ def bulk_import(requestBody: List[TestCase], wait_until_success=True) -> Respons
     return response
 
 
+class ChunkStatus(BaseModel):
+    start: int
+    size: int
+    job_id: str = None
+    status: str
+    errors: List[dict] = []
+
+
+class JobResult(BaseModel):
+    issues: List[dict] = []
+    errors: List[dict] = []
+    warnings: List[dict] = []
+
+
+class BulkImportResult(BaseModel):
+    """
+    Merged outcome of the jobs of `bulk_import_chunks`.
+
+    `result` has the shape of a single job status result, with every
+    `elementNumber` relative to the full list of test cases.
+    """
+    status: str
+    result: JobResult
+    chunks: List[ChunkStatus]
+
+
+def bulk_import_chunks(
+        requestBody: List[TestCase],
+        chunk_size: int = 500,
+        max_workers: int = 4,
+        timeout: float = 600) -> BulkImportResult:
+    """
+    Import test cases as several concurrent bulk jobs of at most `chunk_size` tests.
+
+    All job ids are polled together until they finish or `timeout` seconds
+    elapse. A failing chunk does not stop the others; it is reported in
+    `chunks` with its errors.
+    """
+    chunks = _new_chunks(requestBody, chunk_size)
+
+    def submit(chunk: ChunkStatus) -> None:
+        try:
+            response = bulk_import(requestBody[chunk.start:chunk.start + chunk.size], wait_until_success=False)
+        except Exception as e:
+            chunk.status, chunk.errors = "failed", [{"message": str(e)}]
+            return
+        _submitted(chunk, response)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        list(pool.map(metrics.bind(submit), chunks))
+
+    statuses = check_status_many([c.job_id for c in chunks if c.job_id], max_workers, timeout)
+    return _merge_chunks(chunks, statuses)
+
+
+def _new_chunks(requestBody: List[TestCase], chunk_size: int) -> List[ChunkStatus]:
+    return [ChunkStatus(start=i, size=len(requestBody[i:i + chunk_size]), status="pending")
+            for i in range(0, len(requestBody), chunk_size)]
+
+
+def _submitted(chunk: ChunkStatus, response) -> None:
+    if response.status_code == 200:
+        chunk.job_id = response.json().get('jobId')
+    else:
+        chunk.status, chunk.errors = "failed", [{"message": response.text}]
+
+
+def _merge_chunks(chunks: List[ChunkStatus], statuses: Dict[str, dict]) -> BulkImportResult:
+    merged = JobResult()
+    for chunk in chunks:
+        if not chunk.job_id:
+            continue
+        status = statuses.get(chunk.job_id) or {'status': 'timeout'}
+        chunk.status = status.get('status')
+        result = status.get('result') or {}
+        for issue in result.get('issues') or []:
+            merged.issues.append({**issue, 'elementNumber': issue.get('elementNumber', 0) + chunk.start})
+        chunk.errors = [{**e, 'elementNumber': e['elementNumber'] + chunk.start} if 'elementNumber' in e else e
+                        for e in result.get('errors') or []]
+        if chunk.status != 'successful' and not chunk.errors:
+            chunk.errors = [{"message": f"job {chunk.job_id} ended with status {chunk.status}"}]
+        merged.errors.extend(chunk.errors)
+        merged.warnings.extend(result.get('warnings') or [])
+
+    succeeded = [c for c in chunks if c.status == 'successful']
+    overall = 'successful' if len(succeeded) == len(chunks) else 'partial' if succeeded else 'failed'
+    return BulkImportResult(status=overall, result=merged, chunks=chunks)
+
+
+def check_status_many(job_ids: List[str], max_workers: int = 4, timeout: float = 600) -> Dict[str, dict]:
+    """Poll every job id in parallel until each one leaves the pending/working state."""
+    finished = {}
+    pending = list(job_ids)
+    deadline = time.monotonic() + timeout
+    delays = poll_policy.delays()
+
+    def poll(job_id: str) -> dict:
+        try:
+            return check_status(job_id).json()
+        except Exception as e:
+            logger.warning(f"status of job {job_id}: {e}")
+            return {'status': 'pending'}
+
+    with metrics.phase("poll_import_status"), ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending:
+            for job_id, status in zip(pending, pool.map(metrics.bind(poll), pending)):
+                if status.get('status') not in ('pending', 'working'):
+                    finished[job_id] = status
+            pending = [j for j in pending if j not in finished]
+            if pending:
+                if time.monotonic() >= deadline:
+                    logger.error(f"jobs still running after {timeout}s: {pending}")
+                    break
+                logger.info(f"waiting for {len(pending)} bulk import job(s)")
+                time.sleep(min(next(delays), max(0.0, deadline - time.monotonic())))
+    return finished
+
+
 def check_status(job_id: str) -> Response:
     header = login()
     return get(Endpoint.CHECK_IMPORT_TEST_STATUS.value.format(job_id), header)
 
+class ImportJobError(Exception):
+    """Raised when a bulk import job ends with any status but 'successful'."""
+
+    def __init__(self, job_id: str, response: Response) -> None:
+        status = response.json()
+        super().__init__(f"job {job_id} ended with status {status.get('status')}: "
+                         f"{(status.get('result') or {}).get('errors')}")
+        self.job_id = job_id
+        self.response = response
+
+
 def check_status_retry(job_id: str) -> Response:
-    max_retries = 60
-    retry_interval_secs = 1
-    
-    for i in range(max_retries):
-        response = check_status(job_id)
-        status = response.json().get('status')
-        if status == 'successful':
-            return response
-        else:
-            logger.info(f'Retry {i+1} - status: {status}')
-            time.sleep(retry_interval_secs)
-    
-    raise Exception('Max retries exceeded - import test status not successful')
+    """Poll `job_id` until it finishes; raise `ImportJobError` with its status when it did not succeed."""
+    with metrics.phase("poll_import_status"):
+        return _successful(job_id, poll_policy.poll(check_status, _is_finished, job_id))
+
+
+def _is_finished(response) -> bool:
+    status = response.json().get('status')
+    logger.info(f'import test status: {status}')
+    return status not in ('pending', 'working')
+
+
+def _successful(job_id: str, response) -> Response:
+    if response.json().get('status') != 'successful':
+        raise ImportJobError(job_id, response)
+    return response
+
+
+
+async def bulk_import_async(requestBody: List[TestCase], client, wait_until_success=True):
+    header = await login_async(client)
+    response = await post_async(Endpoint.CREATE_TEST_CASE.value, requestBody, header, client)
+    logger.info("Test bulk import status: " + str(response.status_code))
+    logger.info(response.json())
+    if wait_until_success and response.status_code == 200:
+        return await check_status_retry_async(response.json().get('jobId'), client)
+    return response
+
+
+async def check_status_async(job_id: str, client):
+    header = await login_async(client)
+    return await get_async(Endpoint.CHECK_IMPORT_TEST_STATUS.value.format(job_id), header, client)
+
+
+async def check_status_retry_async(job_id: str, client):
+    with metrics.phase("poll_import_status"):
+        return _successful(job_id, await poll_policy.poll_async(check_status_async, _is_finished, job_id, client))
+
+
+async def bulk_import_chunks_async(
+        requestBody: List[TestCase],
+        client,
+        chunk_size: int = 500,
+        max_workers: int = 4,
+        timeout: float = 600) -> BulkImportResult:
+    """Same as `bulk_import_chunks` through the httpx.AsyncClient `client`, `max_workers` calls at once."""
+    chunks = _new_chunks(requestBody, chunk_size)
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def submit(chunk: ChunkStatus) -> None:
+        try:
+            async with semaphore:
+                response = await bulk_import_async(
+                    requestBody[chunk.start:chunk.start + chunk.size], client, wait_until_success=False)
+        except Exception as e:
+            chunk.status, chunk.errors = "failed", [{"message": str(e)}]
+            return
+        _submitted(chunk, response)
+
+    await asyncio.gather(*[submit(chunk) for chunk in chunks])
+    statuses = await check_status_many_async([c.job_id for c in chunks if c.job_id], client, max_workers, timeout)
+    return _merge_chunks(chunks, statuses)
+
+
+async def check_status_many_async(job_ids: List[str], client, max_workers: int = 4,
+                                  timeout: float = 600) -> Dict[str, dict]:
+    """Same as `check_status_many`, polling at most `max_workers` job ids at once."""
+    finished = {}
+    pending = list(job_ids)
+    deadline = time.monotonic() + timeout
+    delays = poll_policy.delays()
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def poll(job_id: str) -> dict:
+        try:
+            async with semaphore:
+                return (await check_status_async(job_id, client)).json()
+        except Exception as e:
+            logger.warning(f"status of job {job_id}: {e}")
+            return {'status': 'pending'}
 
+    with metrics.phase("poll_import_status"):
+        while pending:
+            for job_id, status in zip(pending, await asyncio.gather(*[poll(j) for j in pending])):
+                if status.get('status') not in ('pending', 'working'):
+                    finished[job_id] = status
+            pending = [j for j in pending if j not in finished]
+            if pending:
+                if time.monotonic() >= deadline:
+                    logger.error(f"jobs still running after {timeout}s: {pending}")
+                    break
+                logger.info(f"waiting for {len(pending)} bulk import job(s)")
+                await asyncio.sleep(min(next(delays), max(0.0, deadline - time.monotonic())))
+    return finished